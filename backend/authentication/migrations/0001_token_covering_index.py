@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# TokenAuthentication looks tokens up by key on every authenticated request.
+# On PostgreSQL a covering index lets that lookup read user_id/created
+# straight from the index instead of visiting the table.
+INDEX_NAME = 'authtoken_token_key_covering_idx'
+
+
+def create_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        # SQLite has no INCLUDE clause; the primary key index is used there
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON authtoken_token ("key") INCLUDE (user_id, created)'
+    )
+
+
+def drop_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0004_alter_tokenproxy_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_covering_index, drop_covering_index),
+    ]
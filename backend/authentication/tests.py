@@ -8,13 +8,14 @@ WHY WE TEST AUTHENTICATION:
 - Error cases must be handled properly
 """
 
-from django.test import TestCase
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.urls import reverse_lazy
+from rest_framework.test import APISimpleTestCase, APITestCase
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-import json
 
 
 class UserModelTestCase(TestCase):
@@ -66,9 +67,12 @@ class UserModelTestCase(TestCase):
         self.assertTrue(user.is_active)  # Users should be active by default
         self.assertFalse(user.is_staff)  # Regular users shouldn't be staff
         
-        # Verify user exists in database
-        self.assertTrue(User.objects.filter(username=self.test_username).exists())
+        # create_user only returns after the INSERT, so a primary key means it's saved
+        self.assertIsNotNone(user.pk)
     
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    ])
     def test_password_hashing(self):
         """
         Test that passwords are properly hashed and not stored in plain text
@@ -138,9 +142,16 @@ class TokenModelTestCase(TestCase):
     - Token-user relationships must work correctly
     """
     
-    def setUp(self):
-        """Set up test user for token tests"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Set up test user for token tests
+        
+        WHY WE USE setUpTestData:
+        - The user is created once per class instead of once per test
+        - Each test still runs in its own transaction, so changes are rolled back
+        """
+        cls.user = User.objects.create_user(
             username="tokenuser",
             password="testpass123"
         )
@@ -166,7 +177,10 @@ class TokenModelTestCase(TestCase):
         
         # Verify token has proper format (40 character hex string)
         self.assertEqual(len(token.key), 40)
-        self.assertTrue(all(c in '0123456789abcdef' for c in token.key))
+        try:
+            bytes.fromhex(token.key)
+        except ValueError:
+            self.fail("Token is not a hex string")
     
     def test_token_uniqueness(self):
         """
@@ -229,22 +243,40 @@ class AuthenticationAPITestCase(APITestCase):
     - Error handling must be robust
     """
     
-    def setUp(self):
-        """Set up test data for API tests"""
-        self.register_url = reverse('register')  # /auth/register/
-        self.login_url = reverse('login')        # /auth/login/
+    # Resolved once on first use instead of in every setUp
+    register_url = reverse_lazy('register')  # /auth/register/
+    login_url = reverse_lazy('login')        # /auth/login/
+    
+    # Request payloads are never mutated, so they are shared by all tests
+    valid_user_data = {
+        'username': 'apitest',
+        'password': 'testpass123',
+        'email': 'api@test.com'
+    }
+    
+    invalid_user_data = {
+        'username': '',  # Invalid: empty username
+        'password': '123',  # Invalid: too short
+        'email': 'invalid-email'  # Invalid: bad format
+    }
+    
+    @classmethod
+    def _seed_user(cls, **overrides):
+        """
+        Create a user and token directly through the ORM
         
-        self.valid_user_data = {
-            'username': 'apitest',
-            'password': 'testpass123',
-            'email': 'api@test.com'
-        }
+        WHY WE BYPASS THE REGISTER ENDPOINT:
+        - Login tests only need an existing account, not the register view
+        - Skips a full request/response round-trip per test
+        - Registration itself is covered by the registration tests
         
-        self.invalid_user_data = {
-            'username': '',  # Invalid: empty username
-            'password': '123',  # Invalid: too short
-            'email': 'invalid-email'  # Invalid: bad format
-        }
+        Returns:
+            Tuple of (user, token)
+        """
+        data = {**cls.valid_user_data, **overrides}
+        user = User.objects.create_user(**data)
+        token = Token.objects.create(user=user)
+        return user, token
     
     def test_user_registration_success(self):
         """
@@ -262,11 +294,14 @@ class AuthenticationAPITestCase(APITestCase):
         - Status codes help frontend handle responses
         - Database consistency must be maintained
         """
-        response = self.client.post(
-            self.register_url, 
-            self.valid_user_data, 
-            format='json'
-        )
+        # Savepoint, INSERT user, INSERT token, release savepoint -
+        # a regression here usually means an extra lookup crept back in
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                self.register_url, 
+                self.valid_user_data, 
+                format='json'
+            )
         
         # Check HTTP status code
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -281,15 +316,8 @@ class AuthenticationAPITestCase(APITestCase):
         token = response_data['token']
         self.assertEqual(len(token), 40)
         
-        # Verify user was created in database
-        user_exists = User.objects.filter(
-            username=self.valid_user_data['username']
-        ).exists()
-        self.assertTrue(user_exists)
-        
-        # Verify token was created and associated with user
-        user = User.objects.get(username=self.valid_user_data['username'])
-        db_token = Token.objects.get(user=user)
+        # Verify the user and their token were created (get() fails if either is missing)
+        db_token = Token.objects.get(user__username=self.valid_user_data['username'])
         self.assertEqual(db_token.key, token)
     
     def test_user_registration_duplicate_username(self):
@@ -309,7 +337,7 @@ class AuthenticationAPITestCase(APITestCase):
         - Helps frontend show appropriate error messages
         """
         # Create first user
-        self.client.post(self.register_url, self.valid_user_data, format='json')
+        self._seed_user()
         
         # Try to create second user with same username
         response = self.client.post(
@@ -326,41 +354,6 @@ class AuthenticationAPITestCase(APITestCase):
         self.assertIn('error', response_data)
         self.assertIn('already exists', response_data['error'].lower())
     
-    def test_user_registration_missing_fields(self):
-        """
-        Test registration with missing required fields
-        
-        WHAT THIS TESTS:
-        - Missing username/password are handled correctly
-        - Returns 400 status code
-        - Clear error messages are provided
-        - No partial user creation occurs
-        
-        WHY THIS IS IMPORTANT:
-        - Validates input before database operations
-        - Prevents incomplete user records
-        - Provides helpful feedback for form validation
-        - Maintains data quality
-        """
-        incomplete_data = {'username': 'testuser'}  # Missing password
-        
-        response = self.client.post(
-            self.register_url, 
-            incomplete_data, 
-            format='json'
-        )
-        
-        # Should return 400 Bad Request
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        
-        # Should contain error message
-        response_data = response.json()
-        self.assertIn('error', response_data)
-        
-        # User should not be created
-        user_exists = User.objects.filter(username='testuser').exists()
-        self.assertFalse(user_exists)
-    
     def test_user_login_success(self):
         """
         Test successful user login via API
@@ -369,7 +362,7 @@ class AuthenticationAPITestCase(APITestCase):
         - Users can login with correct credentials
         - Returns 200 status code
         - Response includes authentication token
-        - Token matches the one from registration
+        - Token matches the user's existing token
         
         WHY THIS IS IMPORTANT:
         - Login enables access to protected features
@@ -377,13 +370,8 @@ class AuthenticationAPITestCase(APITestCase):
         - Proper authentication flow
         - Frontend can store and use token
         """
-        # First register a user
-        register_response = self.client.post(
-            self.register_url, 
-            self.valid_user_data, 
-            format='json'
-        )
-        register_token = register_response.json()['token']
+        # First create a user (registration is tested separately)
+        _, seeded_token = self._seed_user()
         
         # Then login with same credentials
         login_data = {
@@ -391,11 +379,13 @@ class AuthenticationAPITestCase(APITestCase):
             'password': self.valid_user_data['password']
         }
         
-        login_response = self.client.post(
-            self.login_url, 
-            login_data, 
-            format='json'
-        )
+        # SELECT password state (failed-login cache key), SELECT user, SELECT token key
+        with self.assertNumQueries(3):
+            login_response = self.client.post(
+                self.login_url, 
+                login_data, 
+                format='json'
+            )
         
         # Check response
         self.assertEqual(login_response.status_code, status.HTTP_200_OK)
@@ -404,87 +394,121 @@ class AuthenticationAPITestCase(APITestCase):
         self.assertIn('token', response_data)
         self.assertIn('user_id', response_data)
         
-        # Token should be the same as from registration
+        # Token should be the same as the user's existing token
         login_token = response_data['token']
-        self.assertEqual(login_token, register_token)
+        self.assertEqual(login_token, seeded_token.key)
     
-    def test_user_login_invalid_credentials(self):
+    def test_invalid_auth_requests(self):
         """
-        Test login with invalid credentials
+        Test registration and login with invalid input
         
         WHAT THIS TESTS:
-        - Wrong username/password combinations are rejected
-        - Returns 401 Unauthorized status
-        - No token is provided for invalid login
-        - Security: prevents unauthorized access
+        - Missing username/password on registration returns 400
+        - Wrong password on login returns 401
+        - Non-existent username on login returns 401 (not 404, for security)
+        - Every failure has an error message and no token
+        - No partial user creation occurs
         
         WHY THIS IS IMPORTANT:
-        - Prevents unauthorized access to accounts
-        - Provides appropriate HTTP status codes
-        - Security against brute force attacks
-        - Clear feedback for authentication failures
-        """
-        # Register a user first
-        self.client.post(self.register_url, self.valid_user_data, format='json')
-        
-        # Try login with wrong password
-        invalid_login = {
-            'username': self.valid_user_data['username'],
-            'password': 'wrongpassword'
-        }
-        
-        response = self.client.post(
-            self.login_url, 
-            invalid_login, 
-            format='json'
-        )
-        
-        # Should return 401 Unauthorized
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
-        
-        # Should contain error message
-        response_data = response.json()
-        self.assertIn('error', response_data)
-        self.assertIn('invalid', response_data['error'].lower())
+        - Validates input before database operations
+        - Prevents unauthorized access and username enumeration
+        - Provides helpful feedback for form validation
         
-        # Should not contain token
-        self.assertNotIn('token', response_data)
+        WHY WE USE subTest:
+        - All cases share one test setup instead of paying it per case
+        - A failure still reports exactly which case broke
+        """
+        # An existing user for the wrong-password case
+        self._seed_user()
+        
+        cases = [
+            # (name, url, payload, expected status, expected error text)
+            (
+                'registration missing password',
+                self.register_url,
+                {'username': 'testuser'},
+                status.HTTP_400_BAD_REQUEST,
+                'required',
+            ),
+            (
+                'login with wrong password',
+                self.login_url,
+                {'username': self.valid_user_data['username'], 'password': 'wrongpassword'},
+                status.HTTP_401_UNAUTHORIZED,
+                'invalid',
+            ),
+            (
+                'login with nonexistent user',
+                self.login_url,
+                {'username': 'nonexistentuser', 'password': 'anypassword'},
+                status.HTTP_401_UNAUTHORIZED,
+                'invalid',  # Same message as wrong password
+            ),
+        ]
+        
+        for name, url, payload, expected_status, expected_error in cases:
+            with self.subTest(case=name):
+                response = self.client.post(url, payload, format='json')
+                
+                self.assertEqual(response.status_code, expected_status)
+                
+                response_data = response.json()
+                self.assertIn('error', response_data)
+                self.assertIn(expected_error, response_data['error'].lower())
+                self.assertNotIn('token', response_data)
+        
+        # The incomplete registration should not have created a user
+        self.assertFalse(User.objects.filter(username='testuser').exists())
     
-    def test_user_login_nonexistent_user(self):
+    def test_repeated_failed_login_skips_password_check(self):
         """
-        Test login with non-existent username
+        Test that an identical failed login is answered from the cache
         
         WHAT THIS TESTS:
-        - Non-existent usernames are handled correctly
-        - Returns 401 status (not 404, for security)
-        - Error message doesn't reveal user existence
-        - Prevents user enumeration attacks
+        - The first failed attempt runs authenticate()
+        - Repeating the same credentials returns 401 without re-hashing
+        - Registering or changing the password makes the cached failure stale
+        - A cache outage falls through to authenticate()
         
         WHY THIS IS IMPORTANT:
-        - Security: prevents username enumeration
-        - Consistent error responses for all auth failures
-        - Doesn't leak information about valid usernames
-        - Standard security practice
-        """
-        nonexistent_login = {
-            'username': 'nonexistentuser',
-            'password': 'anypassword'
-        }
+        - Password hashing is deliberately slow
+        - Brute-force retries shouldn't cost a hash each time
+        - A fresh account must be able to log in straight away
+        """
+        cache.clear()
+        payload = {'username': 'retryuser', 'password': 'wrongpassword'}
         
-        response = self.client.post(
-            self.login_url, 
-            nonexistent_login, 
-            format='json'
-        )
+        with patch('authentication.views.authenticate', return_value=None) as mock_auth:
+            for _ in range(3):
+                response = self.client.post(self.login_url, payload, format='json')
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         
-        # Should return 401 (not 404, for security)
+        mock_auth.assert_called_once()
+        
+        # Registering with the same credentials makes them valid again
+        self.client.post(self.register_url, payload, format='json')
+        response = self.client.post(self.login_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        # So does setting the password elsewhere (admin site, reset)
+        payload['password'] = 'newpassword'
+        response = self.client.post(self.login_url, payload, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        user = User.objects.get(username='retryuser')
+        user.set_password('newpassword')
+        user.save()
+        response = self.client.post(self.login_url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        # Error message should be generic (don't reveal user doesn't exist)
-        response_data = response.json()
-        self.assertIn('error', response_data)
-        # Message should be same as for wrong password
-        self.assertIn('invalid', response_data['error'].lower())
+        with patch('authentication.views.cache') as mock_cache:
+            mock_cache.get.side_effect = ConnectionError("cache down")
+            mock_cache.set.side_effect = ConnectionError("cache down")
+            for password, expected in (('newpassword', status.HTTP_200_OK),
+                                       ('wrongpassword', status.HTTP_401_UNAUTHORIZED)):
+                with self.subTest(cache='down', password=password):
+                    payload['password'] = password
+                    response = self.client.post(self.login_url, payload, format='json')
+                    self.assertEqual(response.status_code, expected)
 
 
 class TokenAuthenticationTestCase(APITestCase):
@@ -498,112 +522,97 @@ class TokenAuthenticationTestCase(APITestCase):
     - Error handling for invalid/missing tokens
     """
     
-    def setUp(self):
-        """Set up authenticated user for token tests"""
-        self.user = User.objects.create_user(
+    documents_url = '/api/documents/'  # Protected endpoint
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up authenticated user for token tests (once per class)"""
+        cls.user = User.objects.create_user(
             username='tokentest',
             password='testpass123'
         )
-        self.token = Token.objects.create(user=self.user)
-        self.documents_url = '/api/documents/'  # Protected endpoint
+        cls.token = Token.objects.create(user=cls.user)
+        cls.auth_header = f'Token {cls.token.key}'
     
-    def test_access_protected_endpoint_with_valid_token(self):
+    def test_access_protected_endpoint_with_token(self):
         """
-        Test accessing protected endpoint with valid token
+        Test accessing protected endpoint with valid and invalid tokens
         
         WHAT THIS TESTS:
-        - Valid tokens allow access to protected endpoints
-        - Authorization header format is correct
-        - Protected endpoints return expected data
+        - Valid tokens allow access and return JSON data
+        - Invalid (fake) tokens are rejected with 401
         - Token validation works properly
         
         WHY THIS IS IMPORTANT:
         - Ensures authenticated users can access their data
-        - Validates token authentication implementation
+        - Prevents access with fake or manipulated tokens
         - Tests the primary authentication flow
-        - Ensures API security works as designed
-        """
-        # Set authorization header
-        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
-        
-        response = self.client.get(self.documents_url)
-        
-        # Should allow access
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
         
-        # Response should be JSON (documents list)
-        self.assertEqual(response['content-type'], 'application/json')
+        WHY WE USE subTest:
+        - Both cases share the user and token built in setUpTestData
+        - A failure still reports exactly which case broke
+        """
+        cases = [
+            # (name, Authorization header, expected status)
+            ('valid token', self.auth_header, status.HTTP_200_OK),
+            ('invalid token', 'Token fakeinvalidtoken1234567890', status.HTTP_401_UNAUTHORIZED),
+        ]
+        
+        for name, auth_header, expected_status in cases:
+            with self.subTest(case=name):
+                self.client.credentials(HTTP_AUTHORIZATION=auth_header)
+                
+                response = self.client.get(self.documents_url)
+                
+                self.assertEqual(response.status_code, expected_status)
+                if expected_status == status.HTTP_200_OK:
+                    # Response should be JSON (documents list)
+                    self.assertEqual(response['content-type'], 'application/json')
+
+
+class UnauthenticatedAccessTestCase(APISimpleTestCase):
+    """
+    Test that protected endpoints reject requests without a usable token
     
-    def test_access_protected_endpoint_without_token(self):
-        """
-        Test accessing protected endpoint without authentication
-        
-        WHAT THIS TESTS:
-        - Unauthenticated requests are rejected
-        - Returns 401 Unauthorized status
-        - Protected endpoints require authentication
-        - Security: prevents unauthorized data access
-        
-        WHY THIS IS IMPORTANT:
-        - Ensures API security is enforced
-        - Prevents unauthorized access to user data
-        - Validates authentication middleware
-        - Standard security requirement
-        """
-        # Don't set any authorization header
-        response = self.client.get(self.documents_url)
-        
-        # Should deny access
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    WHY THIS IS A SEPARATE CLASS:
+    - These requests are rejected before any token lookup happens
+    - APISimpleTestCase skips the per-test transaction and blocks queries
+    - If one of these tests starts hitting the database, it fails loudly
+    """
     
-    def test_access_protected_endpoint_with_invalid_token(self):
-        """
-        Test accessing protected endpoint with invalid token
-        
-        WHAT THIS TESTS:
-        - Invalid tokens are rejected
-        - Returns 401 Unauthorized status
-        - Token validation catches fake/malformed tokens
-        - Security against token manipulation
-        
-        WHY THIS IS IMPORTANT:
-        - Prevents access with fake tokens
-        - Validates token format and existence
-        - Security against token manipulation attacks
-        - Ensures only valid tokens work
-        """
-        # Use fake token
-        fake_token = 'fakeinvalidtoken1234567890'
-        self.client.credentials(HTTP_AUTHORIZATION=f'Token {fake_token}')
-        
-        response = self.client.get(self.documents_url)
-        
-        # Should deny access
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    documents_url = '/api/documents/'  # Protected endpoint
     
-    def test_access_protected_endpoint_with_malformed_header(self):
+    def test_access_protected_endpoint_without_usable_token(self):
         """
-        Test accessing protected endpoint with malformed auth header
+        Test accessing protected endpoint without a usable auth header
         
         WHAT THIS TESTS:
-        - Malformed Authorization headers are rejected
-        - Header format validation works
-        - Returns appropriate error status
-        - Handles edge cases in token format
+        - Requests with no Authorization header are rejected with 401
+        - Malformed headers (wrong keyword) are rejected with 401
+        - Protected endpoints require authentication
         
         WHY THIS IS IMPORTANT:
+        - Ensures API security is enforced
         - Robust handling of malformed requests
-        - Security against header manipulation
-        - Clear error responses for client debugging
         - Prevents server errors from bad input
         """
-        # Use malformed authorization header
-        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalidformat')
-        
-        response = self.client.get(self.documents_url)
-        
-        # Should deny access
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        cases = [
+            # (name, Authorization header or None)
+            ('no header', None),
+            ('malformed header', 'Bearer invalidformat'),
+        ]
+        
+        for name, auth_header in cases:
+            with self.subTest(case=name):
+                if auth_header is None:
+                    self.client.credentials()
+                else:
+                    self.client.credentials(HTTP_AUTHORIZATION=auth_header)
+                
+                response = self.client.get(self.documents_url)
+                
+                # Should deny access
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
 class AuthenticationIntegrationTestCase(APITestCase):
@@ -702,15 +711,18 @@ class AuthenticationIntegrationTestCase(APITestCase):
         
         response = self.client.post('/auth/register/', user_data, format='json')
         token = response.json()['token']
+        user = User.objects.get(username=user_data['username'])
         
-        # Set credentials
-        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        # The token header itself is covered by TokenAuthenticationTestCase,
+        # so skip the per-request token lookup here
+        self.client.force_authenticate(user=user)
         
-        # Make multiple requests with same token
+        # Make multiple requests as the same user
         for i in range(5):
             response = self.client.get('/api/documents/')
             self.assertEqual(response.status_code, status.HTTP_200_OK)
             
-        # Token should still work after multiple uses
+        # Token should be unchanged after multiple uses
         final_response = self.client.get('/api/documents/')
-        self.assertEqual(final_response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(final_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Token.objects.get(user=user).key, token)
\ No newline at end of file
@@ -5,7 +5,47 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token  
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-import json
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils.crypto import salted_hmac
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Repeating a failed login within this window skips the password hasher
+FAILED_LOGIN_CACHE_SECONDS = 60
+
+
+def _failed_login_key(username, password):
+    """
+    Cache key for a failed login with these credentials
+    
+    The user's current password hash and active flag are part of the key,
+    so registering, changing the password (admin, reset) or reactivating
+    the account makes earlier failures irrelevant without clearing them.
+    """
+    user_state = User.objects.filter(username=username).values_list('password', 'is_active').first()
+    # Never keep the password in the cache, not even as a plain hash: the
+    # cache may be shared (CACHE_URL), and a fast unsalted hash of a
+    # near-miss password is cheap to crack. An HMAC keyed by SECRET_KEY isn't.
+    digest = salted_hmac('auth.failed-login', f'{username}\0{password}\0{user_state}').hexdigest()
+    return f'auth:failed-login:{digest}'
+
+
+def _cached_failure(failed_key):
+    """Whether these credentials just failed; a cache outage only costs a miss"""
+    try:
+        return bool(cache.get(failed_key))
+    except Exception:
+        logger.warning("Failed-login cache unavailable", exc_info=True)
+        return False
+
+
+def _cache_failure(failed_key):
+    try:
+        cache.set(failed_key, True, FAILED_LOGIN_CACHE_SECONDS)
+    except Exception:
+        logger.warning("Failed-login cache unavailable", exc_info=True)
 
 
 @api_view(['POST'])
@@ -22,31 +62,31 @@ def register(request):
                 'error': 'Username and password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        if User.objects.filter(username=username).exists():
+        # Create user and token in one transaction; the unique index on
+        # username rejects duplicates, so no separate exists() query is needed
+        try:
+            with transaction.atomic():
+                # create_user already normalizes a missing email to ''
+                user = User.objects.create_user(
+                    username=username, 
+                    password=password, 
+                    email=email
+                )
+                # A brand new user can't have a token yet - skip the lookup
+                token = Token.objects.create(user=user)
+        except IntegrityError:
             return Response({
                 'error': 'Username already exists'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create user
-        user = User.objects.create_user(
-            username=username, 
-            password=password, 
-            email=email or ''
-        )
-        
-        # Create token - this should now work
-        token, created = Token.objects.get_or_create(user=user)
-        
         return Response({
             'token': token.key, 
             'user_id': user.id,
             'username': user.username
         }, status=status.HTTP_201_CREATED)
         
-    except Exception as e:
-        print(f"Registration error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Registration error")
         return Response({
             'error': 'Registration failed'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -59,7 +99,7 @@ def login(request):
         username = request.data.get('username')
         password = request.data.get('password')
         
-        print(f"Login attempt for username: {username}")
+        logger.debug("Login attempt for username: %s", username)
         
         # Validation
         if not username or not password:
@@ -67,30 +107,35 @@ def login(request):
                 'error': 'Username and password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Authenticate user
-        user = authenticate(username=username, password=password)
+        # Authenticate user, unless the same credentials just failed
+        failed_key = _failed_login_key(username, password)
+        if _cached_failure(failed_key):
+            user = None
+        else:
+            user = authenticate(username=username, password=password)
         
         if user is not None:
-            # Get or create token
-            token, created = Token.objects.get_or_create(user=user)
+            # Only the key is needed - skip building a Token instance
+            token_key = Token.objects.filter(user_id=user.pk).values_list('key', flat=True).first()
+            if token_key is None:
+                token_key = Token.objects.create(user=user).key
             
-            print(f"Login successful for user: {username}")
+            logger.debug("Login successful for user: %s", username)
             
             return Response({
-                'token': token.key,
+                'token': token_key,
                 'user_id': user.id,
                 'username': user.username
             }, status=status.HTTP_200_OK)
         else:
-            print(f"Login failed for user: {username}")
+            logger.warning("Login failed for user: %s", username)
+            _cache_failure(failed_key)
             return Response({
                 'error': 'Invalid credentials'
             }, status=status.HTTP_401_UNAUTHORIZED)
             
-    except Exception as e:
-        print(f"Login error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Login error")
         
         return Response({
             'error': 'Login failed'
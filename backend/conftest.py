@@ -0,0 +1,34 @@
+"""
+pytest hooks for the backend test suite
+
+TestCase wraps every test in a transaction and rolls it back (savepoints
+per test), while TransactionTestCase empties every table after each test.
+That's an order of magnitude slower, so a class may only use it when it
+is marked with @pytest.mark.slow_db to say it really needs commits.
+"""
+
+import pytest
+from django.test import LiveServerTestCase, TransactionTestCase, TestCase
+
+
+def _flushes_database(cls):
+    """True for test classes that truncate tables instead of rolling back"""
+    return (
+        issubclass(cls, (TransactionTestCase, LiveServerTestCase))
+        and not issubclass(cls, TestCase)
+    )
+
+
+def pytest_collection_modifyitems(items):
+    offenders = sorted({
+        item.cls.__qualname__
+        for item in items
+        if item.cls is not None
+        and _flushes_database(item.cls)
+        and item.get_closest_marker('slow_db') is None
+    })
+    if offenders:
+        raise pytest.UsageError(
+            "TransactionTestCase is much slower than TestCase; use TestCase or "
+            "mark the class with @pytest.mark.slow_db: " + ", ".join(offenders)
+        )
@@ -0,0 +1,8 @@
+try:
+    # Make sure the Celery app is loaded when Django starts so @shared_task uses it
+    from .celery import app as celery_app
+except ImportError:
+    # Celery is optional - without it documents are processed in a background thread
+    celery_app = None
+
+__all__ = ('celery_app',)
@@ -0,0 +1,18 @@
+"""
+Celery app for processing uploaded documents on worker processes.
+
+Only used when CELERY_BROKER_URL is set; start a worker with
+`celery -A docqa_backend worker -l info` from the backend/ directory.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'docqa_backend.settings')
+
+app = Celery('docqa_backend')
+
+# Read CELERY_* settings from Django settings
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
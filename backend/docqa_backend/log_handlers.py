@@ -0,0 +1,34 @@
+"""
+Logging handlers that keep log I/O off request and processing threads.
+"""
+
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    FileHandler whose writes happen on one background thread
+
+    Logging threads only put the record on a queue; a QueueListener
+    formats it and writes it to the file.
+    """
+
+    def __init__(self, filename, mode='a', encoding=None):
+        super().__init__(queue.SimpleQueue())
+        self.file_handler = logging.FileHandler(filename, mode=mode, encoding=encoding)
+        self.listener = QueueListener(self.queue, self.file_handler, respect_handler_level=True)
+        self.listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        # Full formatting is the listener's job; prepare() only merges the
+        # message and traceback so the record can cross threads
+        self.file_handler.setFormatter(fmt)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self.file_handler.setLevel(level)
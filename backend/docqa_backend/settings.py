@@ -74,8 +74,42 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson is much faster than the stdlib json module DRF uses by default
+    'DEFAULT_RENDERER_CLASSES': [
+        'drf_orjson_renderer.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'drf_orjson_renderer.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',  # Document uploads
+    ],
 }
 
+# Celery (optional): with a broker such as redis://localhost:6379/0, uploads
+# are processed on Celery workers instead of a thread in the web process
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
+# One worker process per core - embedding and PDF parsing are CPU-bound
+CELERY_WORKER_CONCURRENCY = int(os.getenv('CELERY_WORKER_CONCURRENCY', os.cpu_count() or 1))
+# Processing takes seconds to minutes: take one task at a time, and only
+# acknowledge it when done so a worker restart puts it back on the queue
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+# Where answers to questions asked with "async": true wait to be polled
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CELERY_RESULT_EXPIRES = 3600
+
+# Cache shared by every web and Celery process (generated answers), e.g.
+# redis://localhost:6379/1; without it each process caches in its own memory
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -179,7 +213,8 @@ LOGGING = {
         },
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            # Threads only enqueue records; one background thread writes them
+            'class': 'docqa_backend.log_handlers.QueuedFileHandler',
             'filename': 'django.log',
             'formatter': 'verbose',
         },
@@ -190,5 +225,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'authentication': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
\ No newline at end of file
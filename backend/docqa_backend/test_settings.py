@@ -0,0 +1,67 @@
+"""
+Django settings used when running the test suite.
+
+Imports everything from the regular settings module and only overrides
+what makes tests faster. manage.py picks this module up automatically
+for `python manage.py test`.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+# Run tests against an in-memory SQLite database - no fsync or journal files
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {
+            'NAME': ':memory:',
+        },
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA synchronous=OFF;'     # Nothing to sync for an in-memory DB
+                'PRAGMA journal_mode=MEMORY;' # Keep the rollback journal in RAM
+            ),
+        },
+    }
+}
+
+# PBKDF2 is deliberately slow; tests create and log in users all the time
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+# Don't record every query in connection.queries (assertNumQueries still works)
+DEBUG = False
+
+# Swallow app and request logs - no console noise and no django.log writes
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        name: {
+            'handlers': ['null'],
+            'propagate': False,
+        }
+        for name in ('django', 'documents', 'authentication')
+    },
+}
+
+
+class DisableMigrations:
+    """Every app counts as unmigrated, so tables are created from the models"""
+
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+# Build the test schema directly instead of replaying every migration
+MIGRATION_MODULES = DisableMigrations()
@@ -1,6 +1,20 @@
+import os
+
 from django.apps import AppConfig
 
 
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'documents'
+    
+    def ready(self):
+        from . import signals  # noqa: F401 - connects the receivers
+        
+        # With PRELOAD_MODELS=1, build the shared processor and warm its
+        # embedding model at startup so the first upload or question doesn't
+        # pay for it (use with gunicorn --preload to share the loaded model
+        # between workers)
+        if os.environ.get('PRELOAD_MODELS') == '1':
+            from .services import get_shared_processor
+            
+            get_shared_processor().api_service.get_embeddings(["warmup"])
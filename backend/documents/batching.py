@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Combine embedding requests from concurrent callers into one call
+
+    Each caller hands in one text and blocks. A background thread waits until
+    max_batch_size texts are pending or the oldest has waited max_wait_ms,
+    embeds them all at once and hands every caller its own row.
+    """
+
+    def __init__(self, embed, max_batch_size=32, max_wait_ms=20):
+        """
+        Args:
+            embed: Function taking a list of texts and returning one row per text
+            max_batch_size: Most texts sent in one call
+            max_wait_ms: Longest a text waits for others to join its batch
+        """
+        self.embed = embed
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending = []  # (text, Future) in arrival order
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def embed_one(self, text):
+        """Embed a single text, sharing the call with concurrent callers"""
+        future = Future()
+        with self._condition:
+            self._pending.append((text, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return future.result()
+
+    def _next_batch(self):
+        """Wait for a full batch or the oldest text's deadline, then take the batch"""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                rows = self.embed([text for text, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched embedding of {len(batch)} texts failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), row in zip(batch, rows):
+                future.set_result(row)
@@ -41,55 +41,328 @@ import pickle
 import os
 
 class LocalVectorStore:
-    def __init__(self, dimension=1536):  # OpenAI embedding dimension
+    def __init__(self, dimension=1536, base_dir='', ivf_threshold=10_000, nlist=1024, nprobe=16,
+                 read_only=False, save_every=1, use_gpu=False, index_factory_string=None,
+                 refine_k_factor=20, fp16=True, int8=False):  # OpenAI embedding dimension
         self.dimension = dimension
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
-        self.metadata = []
-        self.index_file = 'vector_index.faiss'
-        self.metadata_file = 'vector_metadata.pkl'
+        
+        # With use_gpu (and a faiss-gpu build), searches run on a GPU copy of
+        # the index. The CPU index stays the source of truth for writes.
+        self.use_gpu = use_gpu and hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0
+        self._gpu_resources = faiss.StandardGpuResources() if self.use_gpu else None
+        self._gpu_index = None  # Rebuilt lazily after the index changes
+        self._gpu_ids = None
+        
+        # Store vectors as float16: search is a memory-bound scan, so half
+        # the bytes is roughly twice the speed (scores shift by ~1e-3).
+        # GPUs can't take a flat SQ index, so there the GPU copy is float16
+        # instead (see _search_gpu) and the CPU index stays float32.
+        self.fp16 = fp16 and hasattr(faiss, 'IndexScalarQuantizer') and not self.use_gpu
+        self._gpu_fp16 = fp16
+        # int8 goes further: one byte per dimension over the fixed [-1, 1]
+        # range of unit-length vectors (a quarter of float32's memory,
+        # cosine scores still within ~1e-2). Takes precedence over fp16.
+        self.int8 = int8 and hasattr(faiss, 'IndexScalarQuantizer') and not self.use_gpu
+        # Inner product for cosine similarity; IDMap2 lets vectors carry our
+        # own int64 ids, so metadata doesn't depend on FAISS row order
+        self.index = faiss.IndexIDMap2(self._new_flat_index())
+        self.metadata = {}  # id -> metadata
+        self._next_id = 0
+        self.index_file = os.path.join(base_dir, 'vector_index.faiss')
+        self.metadata_file = os.path.join(base_dir, 'vector_metadata.pkl')
+        
+        # Exact search is fine for small stores; past ivf_threshold vectors
+        # switch to an IVF index that only scans nprobe of nlist clusters
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        
+        # For very large stores pass e.g. "IVF4096,PQ64,RFlat": vectors are
+        # stored as compact PQ codes, and RFlat re-scores the top
+        # k * refine_k_factor candidates with the full float vectors.
+        # Set ivf_threshold high enough to train it (50k+ vectors for PQ).
+        self.index_factory_string = index_factory_string
+        self.refine_k_factor = refine_k_factor
+        
+        # Search-only stores memory-map the index file instead of copying it
+        # into RAM, so several worker processes can share the page cache
+        self.read_only = read_only
+        
+        # Metadata is appended to disk on every add; the FAISS index is only
+        # rewritten every save_every adds (call save_index() to flush)
+        self.save_every = save_every
+        self._unsaved_adds = 0
+        
+        # Embeddings waiting for flush() - see __enter__
+        self._pending_embeddings = []
+        self._pending_ids = []
+        self._pending_metadata = []
+        self._batching = False
         
         # Load existing index if available
         self.load_index()
     
-    def add_embeddings(self, embeddings: List[List[float]], metadata: List[Dict]):
-        """Add embeddings to the index"""
-        embeddings_array = np.array(embeddings).astype('float32')
+    def add_embeddings(self, embeddings: np.ndarray, metadata: List[Dict], normalized=False, ids=None):
+        """
+        Add embeddings to the index (buffered while inside a `with store:` block)
+        
+        Pass normalized=True for unit-length vectors, e.g. from
+        SentenceTransformer.encode(normalize_embeddings=True), to skip
+        normalizing them again. ids are unique int64s (e.g. DocumentChunk
+        primary keys); by default the next free ids are used.
+        """
+        if self.read_only:
+            raise RuntimeError("Vector store was opened read-only; reopen it with read_only=False to add embeddings")
         
-        # Normalize for cosine similarity
-        faiss.normalize_L2(embeddings_array)
+        if normalized:
+            # No copy when given a float32 array already (flush() concatenates)
+            embeddings_array = np.asarray(embeddings, dtype=np.float32)
+        else:
+            # Normalize a copy for cosine similarity - never the caller's array
+            embeddings_array = np.array(embeddings, dtype=np.float32)
+            faiss.normalize_L2(embeddings_array)
         
-        self.index.add(embeddings_array)
-        self.metadata.extend(metadata)
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + len(embeddings_array), dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+        self._next_id = max(self._next_id, int(ids.max()) + 1) if len(ids) else self._next_id
         
-        # Save index
+        self._pending_embeddings.append(embeddings_array)
+        self._pending_ids.append(ids)
+        self._pending_metadata.extend(metadata)
+        
+        if not self._batching:
+            self.flush()
+    
+    def flush(self):
+        """Add all buffered embeddings to the index in one go"""
+        if not self._pending_embeddings:
+            return
+        
+        embeddings_array = np.concatenate(self._pending_embeddings)
+        ids = np.concatenate(self._pending_ids)
+        new_metadata = dict(zip(ids.tolist(), self._pending_metadata))
+        self._pending_embeddings = []
+        self._pending_ids = []
+        self._pending_metadata = []
+        
+        self.index.add_with_ids(embeddings_array, ids)
+        self.metadata.update(new_metadata)
+        self._gpu_index = None
+        
+        if self.index.ntotal > self.ivf_threshold and faiss.try_extract_index_ivf(self.index) is None:
+            self._build_ivf_index()
+        
+        # Persist only the new metadata instead of re-pickling all of it
+        self._append_metadata(new_metadata)
+        
+        self._unsaved_adds += 1
+        if self._unsaved_adds >= self.save_every:
+            faiss.write_index(self.index, self.index_file)
+            self._unsaved_adds = 0
+    
+    def remove(self, ids):
+        """Remove vectors (and their metadata) by id without rebuilding the index"""
+        if self.read_only:
+            raise RuntimeError("Vector store was opened read-only; reopen it with read_only=False to remove embeddings")
+        
+        self.flush()
+        self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+        self._gpu_index = None
+        for vector_id in ids:
+            self.metadata.pop(int(vector_id), None)
+        
+        # Removals can't be appended to the metadata file - rewrite both
         self.save_index()
     
-    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Dict]:
-        """Search for similar embeddings"""
-        query_array = np.array([query_embedding]).astype('float32')
-        faiss.normalize_L2(query_array)
+    def __enter__(self):
+        # Buffer add_embeddings() calls and write them once on exit
+        self._batching = True
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._batching = False
+        self.flush()
+    
+    def _build_ivf_index(self):
+        """Rebuild the flat index as IVF (or index_factory_string) once there are enough vectors to train on"""
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        ids = faiss.vector_to_array(self.index.id_map)
+        
+        # k-means wants roughly 39 training points per cluster
+        nlist = max(1, min(self.nlist, len(vectors) // 39))
+        factory_string = self.index_factory_string or f"IVF{nlist},{self._flat_codec()}"
+        index = faiss.IndexIDMap2(
+            faiss.index_factory(self.dimension, factory_string, faiss.METRIC_INNER_PRODUCT)
+        )
+        index.train(vectors)
+        index.add_with_ids(vectors, ids)
+        
+        self.index = index
+        self._gpu_index = None
+        self._set_nprobe()
+    
+    def _flat_codec(self):
+        """index_factory name of the vector encoding (int8, float16 or float32)"""
+        if self.int8:
+            return 'SQ8'
+        return 'SQfp16' if self.fp16 else 'Flat'
+    
+    def _new_flat_index(self):
+        """Exact inner-product index, with float16 storage unless fp16 is off"""
+        if self.int8:
+            index = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            # Vectors are unit length, so every component is in [-1, 1]. Train
+            # on exactly that range rather than on the first batch added,
+            # whose min and max could be a single vector's values.
+            index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+            index.sq.rangestat_arg = 0
+            index.train(np.array([[-1.0] * self.dimension, [1.0] * self.dimension], dtype=np.float32))
+            return index
+        if self.fp16:
+            return faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexFlatIP(self.dimension)
+    
+    def _set_nprobe(self):
+        """Apply the nprobe (and refine) settings if the current index uses them"""
+        ivf_index = faiss.try_extract_index_ivf(self.index)
+        if ivf_index is not None:
+            ivf_index.nprobe = self.nprobe
+        
+        inner_index = faiss.downcast_index(self.index.index)
+        if isinstance(inner_index, faiss.IndexRefine):
+            inner_index.k_factor = self.refine_k_factor
+    
+    def search(self, query_embedding: List[float], top_k: int = 5, normalized=False, ids=None) -> List[Dict]:
+        """
+        Search for similar embeddings
+        
+        Pass ids (e.g. one document's chunk ids) to only search those
+        vectors. The filter is applied during the index scan, not to the
+        results, so top_k matches come back whenever that many ids exist.
+        """
+        query_array = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+        if not normalized:
+            faiss.normalize_L2(query_array)
         
-        scores, indices = self.index.search(query_array, top_k)
+        if ids is not None:
+            scores, result_ids = self._search_subset(query_array, top_k, ids)
+        elif self.use_gpu:
+            scores, result_ids = self._search_gpu(query_array, top_k)
+        else:
+            scores, result_ids = self.index.search(query_array, top_k)
         
         results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx != -1:  # Valid result
+        for score, vector_id in zip(scores[0], result_ids[0]):
+            if vector_id != -1:  # Valid result
                 results.append({
-                    'metadata': self.metadata[idx],
+                    'id': int(vector_id),
+                    'metadata': self.metadata[int(vector_id)],
                     'score': float(score)
                 })
         
         return results
     
+    def _search_subset(self, query_array, top_k, ids):
+        """Search the CPU index restricted to the given ids, mapping result rows back to ids"""
+        id_map = faiss.vector_to_array(self.index.id_map)
+        rows = np.flatnonzero(np.isin(id_map, np.asarray(ids, dtype=np.int64))).astype(np.int64)
+        selector = faiss.IDSelectorBatch(rows)
+        
+        inner_index = faiss.downcast_index(self.index.index)
+        refine_index = inner_index if isinstance(inner_index, faiss.IndexRefine) else None
+        base_index = refine_index.base_index if refine_index is not None else inner_index
+        ivf_index = faiss.try_extract_index_ivf(base_index)
+        
+        def params_for(nprobe):
+            if ivf_index is not None:
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+            if refine_index is not None:
+                params = faiss.IndexRefineSearchParameters(k_factor=self.refine_k_factor, base_index_params=params)
+            return params
+        
+        scores, result_rows = inner_index.search(query_array, top_k, params=params_for(self.nprobe))
+        if ivf_index is not None and (result_rows[0] != -1).sum() < min(top_k, len(rows)):
+            # The probed clusters held too few of the ids - scan all of them
+            scores, result_rows = inner_index.search(query_array, top_k, params=params_for(ivf_index.nlist))
+        
+        return scores, self._rows_to_ids(result_rows, id_map)
+    
+    @staticmethod
+    def _rows_to_ids(rows, id_map):
+        """Map index rows to vector ids, keeping -1 for empty result slots"""
+        ids = np.full(rows.shape, -1, dtype=np.int64)
+        found = rows != -1
+        ids[found] = id_map[rows[found]]
+        return ids
+    
+    def _search_gpu(self, query_array, top_k):
+        """Search the GPU copy of the index, mapping result rows back to ids"""
+        if self._gpu_index is None:
+            # Only the inner index goes to the GPU (nprobe is copied along);
+            # ids are mapped here
+            options = faiss.GpuClonerOptions()
+            options.useFloat16 = self._gpu_fp16
+            self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index.index, options)
+            self._gpu_ids = faiss.vector_to_array(self.index.id_map)
+        
+        scores, rows = self._gpu_index.search(query_array, top_k)
+        return scores, self._rows_to_ids(rows, self._gpu_ids)
+    
+    def _append_metadata(self, metadata: Dict[int, Dict]):
+        """Append one batch of metadata to the metadata file"""
+        # The first batch of a new store replaces any stale file
+        mode = 'ab' if len(self.metadata) > len(metadata) else 'wb'
+        with open(self.metadata_file, mode) as f:
+            pickle.dump(metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+    
     def save_index(self):
         """Save index and metadata to disk"""
         faiss.write_index(self.index, self.index_file)
+        # Rewrite the metadata as a single batch, compacting appended ones
         with open(self.metadata_file, 'wb') as f:
-            pickle.dump(self.metadata, f)
+            pickle.dump(self.metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._unsaved_adds = 0
     
     def load_index(self):
         """Load index and metadata from disk"""
         if os.path.exists(self.index_file) and os.path.exists(self.metadata_file):
-            self.index = faiss.read_index(self.index_file)
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.read_only else 0
+            self.index = faiss.read_index(self.index_file, io_flags)
+            self._gpu_index = None
+            
+            # Stores written before vectors had ids hold a bare index; their
+            # ids are the row numbers the old list metadata was indexed by
+            legacy = not isinstance(self.index, faiss.IndexIDMap)
+            if legacy:
+                vectors = self.index.reconstruct_n(0, self.index.ntotal)
+                self.index = faiss.IndexIDMap2(self._new_flat_index())
+                self.index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+            self._set_nprobe()
+            
+            # The file is a sequence of pickled batches - read until EOF
+            self.metadata = {}
             with open(self.metadata_file, 'rb') as f:
-                self.metadata = pickle.load(f)
\ No newline at end of file
+                while True:
+                    try:
+                        batch = pickle.load(f)
+                    except EOFError:
+                        break
+                    self.metadata.update(dict(enumerate(batch)) if isinstance(batch, list) else batch)
+            
+            # Drop metadata for vectors added after the last index write, and
+            # rewrite the file so later appends line up with the index again
+            index_ids = set(faiss.vector_to_array(self.index.id_map).tolist())
+            rewrite = legacy  # Upgrade legacy files to the current format
+            if len(self.metadata) > len(index_ids):
+                self.metadata = {
+                    vector_id: meta for vector_id, meta in self.metadata.items() if vector_id in index_ids
+                }
+                rewrite = True
+            if rewrite and not self.read_only:
+                self.save_index()
+            
+            self._next_id = max(index_ids, default=-1) + 1
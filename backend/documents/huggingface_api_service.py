@@ -1,9 +1,79 @@
 import os
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import requests
 import logging
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .batching import EmbeddingBatcher
 
 logger = logging.getLogger(__name__)
 
+_torch_threads_configured = False
+
+
+def _configure_torch_threads():
+    """
+    Let local embeddings use every core (or TORCH_NUM_THREADS) - once per process
+    
+    Must run before torch is first imported so OMP_NUM_THREADS takes effect.
+    """
+    global _torch_threads_configured
+    if _torch_threads_configured:
+        return
+    _torch_threads_configured = True
+    
+    num_threads = int(os.environ.get('TORCH_NUM_THREADS', os.cpu_count() or 1))
+    os.environ.setdefault('OMP_NUM_THREADS', str(num_threads))
+    
+    try:
+        import torch
+    except ImportError:
+        return
+    
+    torch.set_num_threads(num_threads)
+    try:
+        # One request encodes one batch at a time - no use for inter-op threads
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already fixed once torch has run parallel work
+    logger.info(f"Torch using {num_threads} threads")
+
+
+# all-MiniLM-L6-v2 only looks at the first 256 tokens of each text
+EMBEDDING_MAX_TOKENS = 256
+
+
+@functools.lru_cache(maxsize=None)
+def _get_embedding_tokenizer():
+    """Load the embedding model's fast tokenizer once; None if it isn't usable"""
+    try:
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
+        tokenizer.enable_truncation(max_length=EMBEDDING_MAX_TOKENS)
+        return tokenizer
+    except Exception as e:
+        logger.warning(f"Embedding tokenizer unavailable, truncating by characters: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_token_encoding():
+    """Load the tiktoken encoding once; None if tiktoken isn't usable"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+        return None
+
+
 class HuggingFaceAPIService:
     """
     Simple service that now uses REAL HuggingFace APIs for both embeddings and similarity
@@ -34,6 +104,44 @@ class HuggingFaceAPIService:
             "Content-Type": "application/json"
         }
         
+        # One pooled session keeps TCP/TLS connections alive between calls.
+        # Retried 429/502/503 responses fall through to the status handling
+        # below if they keep failing.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503],
+            allowed_methods=frozenset(['POST']),
+            raise_on_status=False
+        )
+        self.session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retries))
+        
+        # Embeddings of texts we've already seen, keyed by a hash of the text.
+        # Chunks get re-encoded for every question otherwise.
+        self._embedding_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.embedding_cache_size = 10_000
+        
+        # Answers already generated for the same question and context; also
+        # kept in Django's cache so other processes (and restarts) reuse them
+        self._answer_cache = OrderedDict()
+        self.answer_cache_size = 256
+        self.shared_answer_ttl = 24 * 60 * 60
+        
+        # Context sent to the chat model is cut to this many tokens
+        self.max_context_tokens = 500
+        
+        # With EMBEDDING_WAIT_MS set, questions asked at the same time are
+        # embedded together in one model call / API request
+        wait_ms = float(os.environ.get('EMBEDDING_WAIT_MS', 0))
+        self._question_batcher = EmbeddingBatcher(
+            lambda texts: self.get_embeddings(texts, as_numpy=True),
+            max_batch_size=int(os.environ.get('EMBEDDING_BATCH_SIZE', 32)),
+            max_wait_ms=wait_ms
+        ) if wait_ms > 0 else None
+        
         # Initialize embedding method
         self._init_embeddings()
     
@@ -42,12 +150,17 @@ class HuggingFaceAPIService:
         Try to use the best available embedding method
         Priority: Local -> API -> Fake
         """
+        self.embedding_batch_size = 32  # CPU default, raised for GPUs
+        self.api_batch_size = 32  # Texts per embeddings API request
+        self.api_max_workers = 4  # Embeddings API requests in flight at once
+        
         # Try local embeddings first (recommended)
         try:
+            _configure_torch_threads()
             from sentence_transformers import SentenceTransformer
             
             logger.info("Loading local embedding model...")
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embedding_model = self._load_local_model(SentenceTransformer)
             self.embedding_method = "local"
             logger.info("[SUCCESS] Local embeddings ready (FREE and FAST!)")
             
@@ -69,59 +182,163 @@ class HuggingFaceAPIService:
                 self.embedding_method = "fake"
                 logger.warning("Using fake embeddings (for testing only)")
     
-    def get_embeddings(self, texts):
+    def _load_local_model(self, SentenceTransformer):
+        """
+        Load the local embedding model
+        
+        Set EMBEDDING_BACKEND=onnx to run an int8-quantized ONNX export instead
+        of the PyTorch model (needs `pip install sentence-transformers[onnx]`).
+        ONNX_MODEL_FILE picks the export; the default suits most x86 CPUs.
+        The PyTorch model runs on a GPU (CUDA or Apple MPS) when there is one.
+        """
+        if os.environ.get('EMBEDDING_BACKEND', 'torch') == 'onnx':
+            try:
+                model = SentenceTransformer(
+                    'all-MiniLM-L6-v2',
+                    backend='onnx',
+                    model_kwargs={'file_name': os.environ.get('ONNX_MODEL_FILE', 'onnx/model_quint8_avx2.onnx')}
+                )
+                logger.info("Using quantized ONNX embedding model")
+                return model
+            except Exception as e:
+                logger.warning(f"ONNX embedding model failed, using PyTorch: {e}")
+        
+        import torch
+        if torch.cuda.is_available():
+            device = 'cuda'
+        elif torch.backends.mps.is_available():
+            device = 'mps'
+        else:
+            device = 'cpu'
+        
+        if device != 'cpu':
+            self.embedding_batch_size = 128  # GPUs want bigger batches
+        logger.info(f"Embedding model device: {device}")
+        
+        return SentenceTransformer('all-MiniLM-L6-v2', device=device)
+    
+    def get_embeddings(self, texts, as_numpy=False, batch_size=None, fallback=True):
         """
         Generate embeddings for texts using the best available method
         
         Args:
             texts: List of strings like ["Hello world", "How are you?"]
+            as_numpy: Return a float32 numpy array instead of lists, which
+                saves converting every number to a Python float
+            batch_size: Texts per model batch / API request (defaults to
+                embedding_batch_size / api_batch_size)
+            fallback: Return placeholder embeddings if no real ones can be
+                made; pass False to get an exception instead, e.g. before
+                storing them
         
         Returns:
             List of lists with numbers that represent meaning
         """
         if not texts:
-            return []
+            return np.empty((0, 0), dtype=np.float32) if as_numpy else []
         
         logger.info(f"Generating {self.embedding_method} embeddings for {len(texts)} texts")
         
         try:
             if self.embedding_method == "local":
-                return self._get_local_embeddings(texts)
+                embeddings = self._get_cached_embeddings(
+                    texts, functools.partial(self._get_local_embeddings, batch_size=batch_size)
+                )
             elif self.embedding_method == "api":
-                return self._get_api_embeddings(texts)
+                embeddings = self._get_cached_embeddings(
+                    texts, functools.partial(self._get_api_embeddings, batch_size=batch_size)
+                )
+            elif not fallback:
+                raise RuntimeError("No embedding model or API available")
             else:
-                return self._get_fake_embeddings(texts)
+                embeddings = self._get_fake_embeddings(texts)
                 
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
+            if not fallback:
+                raise
             # Fallback to fake embeddings if real ones fail
-            return self._get_fake_embeddings(texts)
+            embeddings = self._get_fake_embeddings(texts)
+        
+        if as_numpy:
+            return np.asarray(embeddings, dtype=np.float32)
+        if isinstance(embeddings, np.ndarray):
+            return embeddings.tolist()
+        return embeddings
     
-    def _get_local_embeddings(self, texts):
+    def _get_cached_embeddings(self, texts, encode):
+        """Embed texts, only calling encode() for texts that aren't cached yet"""
+        keys = [hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest() for text in texts]
+        
+        with self._cache_lock:
+            rows = [self._embedding_cache.get(key) for key in keys]
+        
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            new_embeddings = np.asarray(encode([texts[i] for i in missing]), dtype=np.float32)
+            for i, embedding in zip(missing, new_embeddings):
+                rows[i] = embedding
+        
+        with self._cache_lock:
+            for key, row in zip(keys, rows):
+                self._embedding_cache[key] = row
+                self._embedding_cache.move_to_end(key)
+            while len(self._embedding_cache) > self.embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+        
+        return np.stack(rows)
+    
+    def _get_local_embeddings(self, texts, batch_size=None):
         """Generate embeddings using local model (RECOMMENDED)"""
         try:
-            embeddings = self.embedding_model.encode(texts)
-            embeddings_list = embeddings.tolist()
-            logger.info(f"[SUCCESS] Generated {len(embeddings_list)} local embeddings")
-            return embeddings_list
+            # Normalizing here lets cosine similarity be a plain dot product.
+            # No need to sort texts by length first: encode() already does
+            # length-sorted batching and returns results in input order.
+            embeddings = self.embedding_model.encode(
+                texts,
+                batch_size=batch_size or self.embedding_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            logger.info(f"[SUCCESS] Generated {len(embeddings)} local embeddings")
+            return embeddings
         except Exception as e:
             logger.error(f"Local embedding error: {e}")
             raise
     
-    def _get_api_embeddings(self, texts):
+    def _get_api_embeddings(self, texts, batch_size=None):
         """Generate embeddings using HuggingFace API with better error handling"""
+        batch_size = batch_size or self.api_batch_size
+        if len(texts) > batch_size:
+            # Send sized requests instead of one huge payload; grouping texts
+            # of similar length means less padding on the server
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+            
+            # The requests are network-bound: keep a few in flight on the
+            # pooled session instead of waiting for each in turn
+            with ThreadPoolExecutor(max_workers=min(self.api_max_workers, len(batches))) as executor:
+                results = executor.map(
+                    lambda batch: self._get_api_embeddings([texts[i] for i in batch], batch_size),
+                    batches
+                )
+                # Scatter each batch straight into one (N, d) float32 array
+                embeddings = None
+                for batch, batch_embeddings in zip(batches, results):
+                    batch_embeddings = np.asarray(batch_embeddings, dtype=np.float32)
+                    if embeddings is None:
+                        embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+                    embeddings[batch] = batch_embeddings
+            return embeddings
+        
         try:
             # Validate input
             if not texts or not all(isinstance(text, str) for text in texts):
                 raise ValueError("All inputs must be non-empty strings")
             
             # Limit text length to avoid API errors
-            processed_texts = []
-            for text in texts:
-                if len(text) > 5000:  # Truncate very long texts
-                    processed_texts.append(text[:5000] + "...")
-                else:
-                    processed_texts.append(text)
+            processed_texts = self._truncate_for_embedding(texts)
             
             data = {
                 "inputs": processed_texts,
@@ -131,9 +348,8 @@ class HuggingFaceAPIService:
                 }
             }
             
-            response = requests.post(
+            response = self.session.post(
                 self.embeddings_url,
-                headers=self.headers,
                 json=data,
                 timeout=60  # Longer timeout
             )
@@ -173,17 +389,38 @@ class HuggingFaceAPIService:
             logger.error(f"API embedding error: {e}")
             raise
         
+    def _truncate_for_embedding(self, texts):
+        """Cut texts to the model's token window so we don't upload what it ignores"""
+        # Every token covers at least one character, so shorter texts (with
+        # room for [CLS]/[SEP]) can't overflow - skip tokenizing them
+        long_indices = [i for i, text in enumerate(texts) if len(text) > EMBEDDING_MAX_TOKENS - 2]
+        processed_texts = list(texts)
+        if not long_indices:
+            return processed_texts
+        
+        tokenizer = _get_embedding_tokenizer()
+        if tokenizer is None:
+            for i in long_indices:
+                if len(texts[i]) > 5000:  # Truncate very long texts
+                    processed_texts[i] = texts[i][:5000] + "..."
+            return processed_texts
+        
+        encodings = tokenizer.encode_batch([texts[i] for i in long_indices])
+        for i, encoding in zip(long_indices, encodings):
+            if encoding.overflowing:
+                # Keep the original text up to the end of the last kept token
+                processed_texts[i] = texts[i][:max(end for _, end in encoding.offsets)]
+        return processed_texts
+    
     def _get_fake_embeddings(self, texts):
-        """Generate fake embeddings (ONLY for testing)"""
-        fake_embeddings = []
-        for i, text in enumerate(texts):
-            embedding = [
-                len(text) * 0.01,
-                text.count(' ') * 0.02,
-                text.count('a') * 0.03,
-                hash(text) % 100 * 0.01
-            ]
-            fake_embeddings.append(embedding)
+        """Generate fake embeddings (ONLY for testing, and as the fallback when the API fails)"""
+        text_array = np.asarray(texts, dtype=str)
+        fake_embeddings = np.column_stack([
+            np.char.str_len(text_array) * 0.01,
+            np.char.count(text_array, ' ') * 0.02,
+            np.char.count(text_array, 'a') * 0.03,
+            np.fromiter((hash(text) for text in texts), dtype=np.int64, count=len(texts)) % 100 * 0.01
+        ])
         
         logger.warning(f"Generated {len(fake_embeddings)} FAKE embeddings (testing only)")
         return fake_embeddings
@@ -199,6 +436,10 @@ class HuggingFaceAPIService:
         Returns:
             List of similarity scores (0.0 to 1.0)
         """
+        if self.embedding_method == "local":
+            # The model is loaded anyway - no need for a round trip to the API
+            return self._get_local_similarity(source_sentence, target_sentences)
+        
         if not self.hf_token:
             logger.warning("No HF_TOKEN available for similarity calculation")
             # Return fake similarities for testing
@@ -216,9 +457,8 @@ class HuggingFaceAPIService:
             }
             
             # Call the similarity API
-            response = requests.post(
+            response = self.session.post(
                 self.similarity_url,
-                headers=self.headers,
                 json=payload,
                 timeout=30
             )
@@ -227,10 +467,11 @@ class HuggingFaceAPIService:
                 similarities = response.json()
                 logger.info(f"[SUCCESS] Got {len(similarities)} similarity scores")
                 
-                # Log the scores for debugging
-                for i, (sentence, score) in enumerate(zip(target_sentences, similarities)):
-                    preview = sentence[:50] + "..." if len(sentence) > 50 else sentence
-                    logger.info(f"  {i+1}. Score: {score:.3f} - {preview}")
+                # Log every score only when debugging - one line per chunk
+                if logger.isEnabledFor(logging.DEBUG):
+                    for i, (sentence, score) in enumerate(zip(target_sentences, similarities)):
+                        preview = sentence[:50] + "..." if len(sentence) > 50 else sentence
+                        logger.debug(f"  {i+1}. Score: {score:.3f} - {preview}")
                 
                 return similarities
             
@@ -254,7 +495,65 @@ class HuggingFaceAPIService:
             logger.error(f"Error calculating similarity: {e}")
             raise
     
-    def find_most_relevant_chunks(self, question, chunk_contents, top_k=3):
+    def _get_local_similarity(self, source_sentence, target_sentences):
+        """Cosine similarity with the local model (embeddings are unit length)"""
+        if not target_sentences:
+            return []
+        
+        embeddings = self._get_cached_embeddings([source_sentence] + list(target_sentences), self._get_local_embeddings)
+        similarities = embeddings[1:] @ embeddings[0]
+        
+        logger.info(f"[SUCCESS] Got {len(similarities)} local similarity scores")
+        return similarities.tolist()
+    
+    def _get_stored_similarity(self, question, chunk_embeddings):
+        """Cosine similarity of the question against precomputed chunk embeddings"""
+        if self._question_batcher is not None:
+            query = np.asarray(self._question_batcher.embed_one(question), dtype=np.float32).reshape(1, -1)
+        else:
+            query = self.get_embeddings([question], as_numpy=True)
+        if query.ndim != 2 or query.shape[1] != chunk_embeddings.shape[1]:
+            # Chunks were embedded with a different model - can't compare
+            logger.warning("Stored chunk embeddings don't match the embedding model")
+            return None
+        
+        query = query[0]
+        norm = np.linalg.norm(query)
+        similarities = chunk_embeddings @ (query / norm if norm > 0 else query)
+        
+        logger.info(f"[SUCCESS] Scored {len(similarities)} chunks against stored embeddings")
+        return similarities
+    
+    def calculate_similarity_batch(self, pairs, max_workers=8):
+        """
+        Run several similarity requests at once instead of one after another
+        
+        Args:
+            pairs: List of (source_sentence, target_sentences) tuples
+            max_workers: Maximum number of requests in flight
+            
+        Returns:
+            List of similarity score lists, in the same order as pairs
+        """
+        if not pairs:
+            return []
+        
+        # Requests share the session's connection pool (16 connections)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as executor:
+            return list(executor.map(lambda pair: self.calculate_similarity(*pair), pairs))
+    
+    def find_most_relevant_chunks_batch(self, questions, chunk_contents, top_k=3, max_workers=8):
+        """Find the most relevant chunks for several questions concurrently"""
+        if not questions:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(questions))) as executor:
+            return list(executor.map(
+                lambda question: self.find_most_relevant_chunks(question, chunk_contents, top_k=top_k),
+                questions
+            ))
+    
+    def find_most_relevant_chunks(self, question, chunk_contents, top_k=3, chunk_embeddings=None):
         """
         Find the most relevant chunks for a question using similarity API
         
@@ -262,6 +561,8 @@ class HuggingFaceAPIService:
             question: The question to find relevant content for
             chunk_contents: List of text chunks to search through
             top_k: Number of top relevant chunks to return
+            chunk_embeddings: Optional (N, d) array of the chunks' unit-length
+                embeddings; then only the question is embedded
             
         Returns:
             List of dicts with 'content' and 'similarity_score'
@@ -272,23 +573,29 @@ class HuggingFaceAPIService:
         logger.info(f"Finding most relevant chunks for: '{question}'")
         
         try:
-            # Calculate similarity scores using HF API
-            similarities = self.calculate_similarity(question, chunk_contents)
+            similarities = None
+            if chunk_embeddings is not None:
+                similarities = self._get_stored_similarity(question, chunk_embeddings)
+            if similarities is None:
+                # Calculate similarity scores using HF API
+                similarities = self.calculate_similarity(question, chunk_contents)
             
-            # Pair chunks with their similarity scores
-            chunk_scores = []
-            for i, (content, score) in enumerate(zip(chunk_contents, similarities)):
-                chunk_scores.append({
-                    'content': content,
-                    'similarity_score': float(score),
-                    'index': i
-                })
+            scores = np.asarray(similarities, dtype=np.float64)[:len(chunk_contents)]
+            k = max(0, min(top_k, len(scores)))
             
-            # Sort by similarity score (highest first)
-            chunk_scores.sort(key=lambda x: x['similarity_score'], reverse=True)
+            # Pick the top k in O(n), then sort only those (highest first,
+            # ties in document order) - no need to sort every chunk
+            top_indices = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+            top_indices = top_indices[np.lexsort((top_indices, -scores[top_indices]))]
             
-            # Return top k results
-            top_chunks = chunk_scores[:top_k]
+            top_chunks = [
+                {
+                    'content': chunk_contents[i],
+                    'similarity_score': float(scores[i]),
+                    'index': int(i)
+                }
+                for i in top_indices
+            ]
             
             logger.info(f"[SUCCESS] Found top {len(top_chunks)} relevant chunks:")
             for i, chunk in enumerate(top_chunks, 1):
@@ -326,6 +633,20 @@ class HuggingFaceAPIService:
         if not self.hf_token:
             return "Sorry, no API token available for AI responses. Set HF_TOKEN in your environment."
         
+        context = self._truncate_to_tokens(context, self.max_context_tokens)
+        
+        cache_key = hashlib.blake2b(f'{question}\0{context}'.encode('utf-8'), digest_size=16).digest()
+        with self._cache_lock:
+            cached_answer = self._answer_cache.get(cache_key)
+            if cached_answer is not None:
+                self._answer_cache.move_to_end(cache_key)
+        if cached_answer is None:
+            cached_answer = self._get_shared_answer(cache_key)
+        if cached_answer is not None:
+            logger.info("[SUCCESS] Reusing cached AI answer")
+            self._remember_answer(cache_key, cached_answer)
+            return cached_answer
+        
         # Create the prompt for the AI
         prompt = f"""
         Context: {context}
@@ -350,9 +671,8 @@ class HuggingFaceAPIService:
         
         try:
             logger.info("Sending question to AI...")
-            response = requests.post(
+            response = self.session.post(
                 self.chat_url,
-                headers=self.headers,
                 json=data,
                 timeout=30
             )
@@ -361,9 +681,13 @@ class HuggingFaceAPIService:
                 result = response.json()
                 
                 if "choices" in result and len(result["choices"]) > 0:
-                    answer = result["choices"][0]["message"]["content"]
+                    answer = result["choices"][0]["message"]["content"].strip()
                     logger.info("[SUCCESS] Got AI answer")
-                    return answer.strip()
+                    
+                    # Only real answers are cached - errors should be retried
+                    self._remember_answer(cache_key, answer)
+                    self._set_shared_answer(cache_key, answer)
+                    return answer
                 else:
                     return "Sorry, got an unexpected response from the AI."
             
@@ -384,6 +708,48 @@ class HuggingFaceAPIService:
             logger.error(f"AI answer error: {e}")
             return "An error occurred while getting AI response. Please try again."
     
+    def _remember_answer(self, cache_key, answer):
+        with self._cache_lock:
+            self._answer_cache[cache_key] = answer
+            self._answer_cache.move_to_end(cache_key)
+            while len(self._answer_cache) > self.answer_cache_size:
+                self._answer_cache.popitem(last=False)
+    
+    def _get_shared_answer(self, cache_key):
+        """Answer cached by any process, or None; a cache outage only costs a miss"""
+        try:
+            return cache.get(f'answer:{cache_key.hex()}')
+        except Exception as e:
+            logger.warning(f"Shared answer cache unavailable: {e}")
+            return None
+    
+    def _set_shared_answer(self, cache_key, answer):
+        try:
+            cache.set(f'answer:{cache_key.hex()}', answer, self.shared_answer_ttl)
+        except Exception as e:
+            logger.warning(f"Shared answer cache unavailable: {e}")
+    
+    def _truncate_to_tokens(self, text, max_tokens):
+        """Cut text to max_tokens tokens (counted with tiktoken when available)"""
+        # Byte-level BPE never produces more tokens than bytes
+        if len(text.encode('utf-8')) <= max_tokens:
+            return text
+        
+        encoding = _get_token_encoding()
+        if encoding is None:
+            max_chars = max_tokens * 4  # Roughly 4 characters per English token
+            if len(text) <= max_chars:
+                return text
+            truncated = text[:max_chars]
+        else:
+            tokens = encoding.encode(text)
+            if len(tokens) <= max_tokens:
+                return text
+            truncated = encoding.decode(tokens[:max_tokens])
+        
+        logger.info("Truncated context to %d tokens", max_tokens)
+        return truncated + "..."
+    
     def get_service_info(self):
         """Get information about what services are currently being used"""
         info = {
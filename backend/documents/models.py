@@ -3,11 +3,18 @@ from django.contrib.auth.models import User
 
 
 class Document(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     file = models.FileField(upload_to='documents/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     
     def __str__(self):
         return self.title
@@ -18,6 +25,8 @@ class DocumentChunk(models.Model):
     content = models.TextField()
     chunk_index = models.IntegerField()
     embedding_id = models.CharField(max_length=100, null=True, blank=True)
+    embedding = models.BinaryField(null=True, blank=True)  # Unit-length vector: int8 if scaled, else float32
+    embedding_scale = models.FloatField(null=True, blank=True)  # int8 value * scale = vector component
     
     class Meta:
         unique_together = ['document', 'chunk_index']
\ No newline at end of file
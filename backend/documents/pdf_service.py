@@ -0,0 +1,61 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Below this many pages a single process is faster than starting workers
+PARALLEL_MIN_PAGES = 64
+
+
+def _extract_page_range(file_path, start, stop):
+    """Extract text from pages [start, stop) - runs in a worker process"""
+    with fitz.open(file_path) as pdf:
+        return [pdf[i].get_text("text") for i in range(start, stop)]
+
+
+def extract_pdf_text(file_path, max_workers=None, parallel_min_pages=PARALLEL_MIN_PAGES, data=None):
+    """
+    Extract the text of every page of a PDF
+
+    PyMuPDF holds the GIL and a document can't be shared between threads,
+    so large PDFs are split into page ranges that worker processes open
+    and extract on their own.
+
+    Args:
+        file_path: Path to the PDF file
+        max_workers: Worker processes to use (defaults to the CPU count, at most 8)
+        parallel_min_pages: Only PDFs with at least this many pages use workers
+        data: The PDF's bytes, if already in memory (read in this process)
+
+    Returns:
+        Tuple of (text with pages joined by newlines, page count)
+    """
+    if data is not None:
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            return "\n".join(page.get_text("text") for page in pdf), pdf.page_count
+
+    with fitz.open(file_path) as pdf:
+        page_count = pdf.page_count
+        workers = min(max_workers or os.cpu_count() or 1, 8, page_count)
+        if page_count < parallel_min_pages or workers <= 1:
+            return "\n".join(page.get_text("text") for page in pdf), page_count
+
+    # Contiguous page ranges, one per worker, so each opens the file once
+    step = -(-page_count // workers)
+    starts = range(0, page_count, step)
+    stops = [min(start + step, page_count) for start in starts]
+
+    try:
+        # spawn: forking a threaded Django process can deadlock the child
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            parts = list(executor.map(_extract_page_range, repeat(file_path), starts, stops))
+    except Exception as e:
+        logger.warning(f"Parallel PDF extraction failed, reading pages sequentially: {e}")
+        parts = [_extract_page_range(file_path, 0, page_count)]
+
+    return "\n".join(text for part in parts for text in part), page_count
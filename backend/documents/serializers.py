@@ -5,5 +5,5 @@ from .models import Document
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = ['id', 'title', 'file', 'uploaded_at', 'processed']
-        read_only_fields = ['uploaded_at', 'processed']
\ No newline at end of file
+        fields = ['id', 'title', 'file', 'uploaded_at', 'processed', 'status']
+        read_only_fields = ['uploaded_at', 'processed', 'status']
\ No newline at end of file
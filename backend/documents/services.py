@@ -1,14 +1,44 @@
+import io
 import os
+import re
 import logging
+import heapq
+import threading
+import numpy as np
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from .models import Document, DocumentChunk
 from .huggingface_api_service import HuggingFaceAPIService
 import time
 import random
+from functools import lru_cache
 from django.db import transaction, connection
 
 logger = logging.getLogger(__name__)
 
+# Sentence boundary: whitespace after ., ! or ? (so decimals like "3.14" stay whole)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+@lru_cache(maxsize=1)
+def get_shared_api_service():
+    """
+    One HuggingFaceAPIService per process
+    
+    Creating it loads the embedding model, so every DocumentProcessor
+    shares this instance (and its embedding/answer caches)
+    """
+    api_service = HuggingFaceAPIService()
+    
+    # Check what capabilities we have
+    info = api_service.get_service_info()
+    logger.info(f"HuggingFace service initialized:")
+    logger.info(f"  Embeddings: {info['embedding_method']}")
+    logger.info(f"  Similarity API: {'Available' if info['has_similarity_api'] else 'Not available'}")
+    logger.info(f"  Production ready: {'Yes' if info['ready_for_production'] else 'No'}")
+    return api_service
+
 
 class DocumentProcessor:
     """
@@ -16,22 +46,46 @@ class DocumentProcessor:
     with integrated similarity search capabilities
     """
     
-    def __init__(self):
-        # Create our enhanced API service
-        self.api_service = HuggingFaceAPIService()
+    def __init__(self, api_service=None):
+        """
+        Args:
+            api_service: Embedding/answering backend with the
+                HuggingFaceAPIService interface; defaults to the shared
+                per-process instance, so the model is only loaded once
+        """
+        self.api_service = api_service if api_service is not None else get_shared_api_service()
         
-        # Check what capabilities we have
-        info = self.api_service.get_service_info()
-        logger.info(f"DocumentProcessor initialized:")
-        logger.info(f"  Embeddings: {info['embedding_method']}")
-        logger.info(f"  Similarity API: {'Available' if info['has_similarity_api'] else 'Not available'}")
-        logger.info(f"  Production ready: {'Yes' if info['ready_for_production'] else 'No'}")
+        # Retrieved context per (normalized question, document); the corpus
+        # version is part of the key so processing a document invalidates it
+        self._context_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.context_cache_size = 1024
+        self._corpus_version = 0
+        
+        # Chunks beyond this many characters would be cut by the API
+        # service's 500-token context limit anyway (~4 characters per token)
+        self.max_context_chars = 2000
+        
+        # (chunk contents, stored embedding matrix or None) per document and
+        # corpus version, so questions don't reload the vectors every time;
+        # bounded by entry count and by the memory the entries hold
+        self._chunk_cache = OrderedDict()
+        self._chunk_cache_bytes = 0
+        self.chunk_cache_size = 8
+        self.chunk_cache_max_bytes = 256 * 1024 * 1024
+        
+        # Keyword fallback postings {word: [chunk index, ...]} per chunk set
+        self._inverted_indexes = OrderedDict()
+        self.inverted_index_cache_size = 32
     
     def process_document(self, document: Document):
         """Process document with database retry logic"""
         max_retries = 3
         retry_delay = 1
         
+        document.status = Document.Status.PROCESSING
+        Document.objects.filter(pk=document.pk).update(status=document.status)
+        
         for attempt in range(max_retries):
             try:
                 with transaction.atomic():
@@ -51,6 +105,7 @@ class DocumentProcessor:
                     # Final attempt failed or different error
                     logger.error(f"Error processing document {document.id}: {e}")
                     document.processed = False
+                    document.status = Document.Status.FAILED
                     document.save()
                     raise
     
@@ -60,17 +115,30 @@ class DocumentProcessor:
         
         try:
             # Step 1: Read the file content
-            file_path = document.file.path
-            content = self._read_file(file_path)
+            try:
+                file_path = document.file.path
+            except NotImplementedError:
+                file_path = None
+            if file_path and os.path.exists(file_path):
+                data = None
+            else:
+                # Storage without local files (InMemoryStorage reports a path
+                # that doesn't exist, S3 has none): read the bytes instead
+                file_path = document.file.name
+                with document.file.open('rb') as f:
+                    data = f.read()
+            content = self._read_file(file_path, data=data)
             logger.info(f"Read {len(content)} characters from file")
             
             # Step 2: Break content into smaller chunks
             chunks = self._split_into_chunks(content)
             logger.info(f"Split document into {len(chunks)} chunks")
             
-            # Step 3: Generate embeddings (with better error handling)
+            # Step 3: Generate embeddings (with better error handling). No
+            # placeholder vectors: they would be stored for good, so on
+            # failure save none and let questions embed the chunks instead
             try:
-                embeddings = self.api_service.get_embeddings(chunks)
+                embeddings = self.api_service.get_embeddings(chunks, as_numpy=True, fallback=False)
                 logger.info(f"Generated {len(embeddings)} embeddings")
             except Exception as e:
                 logger.warning(f"Embedding generation failed: {e}")
@@ -80,23 +148,31 @@ class DocumentProcessor:
             # Step 4: Save chunks to database (batch create for better performance)
             created_chunks = []
             chunk_data = []
+            quantized = self._quantize_embeddings(embeddings, len(chunks))
             
             for i, chunk_text in enumerate(chunks):
                 chunk_data.append(DocumentChunk(
                     document=document,
                     content=chunk_text,
                     chunk_index=i,
-                    embedding_id=f"{document.id}_{i}"
+                    embedding_id=f"{document.id}_{i}",
+                    embedding=quantized[i][0],
+                    embedding_scale=quantized[i][1]
                 ))
             
-            # Bulk create for better performance and less lock contention
-            created_chunks = DocumentChunk.objects.bulk_create(chunk_data)
+            # Bulk create for better performance and less lock contention;
+            # batch_size keeps each INSERT under SQLite's variable limit
+            created_chunks = DocumentChunk.objects.bulk_create(chunk_data, batch_size=500)
             logger.info(f"Saved {len(created_chunks)} chunks")
             
             # Step 5: Mark document as processed
             document.processed = True
+            document.status = Document.Status.DONE
             document.save()
             
+            # New content may change which chunks answer a question
+            self._corpus_version += 1
+            
             logger.info(f"[SUCCESS] Successfully processed document: {document.title}")
             return created_chunks
             
@@ -104,12 +180,125 @@ class DocumentProcessor:
             logger.error(f"Error in document processing implementation: {e}")
             raise
         
-    def _read_file(self, file_path):
+    def _quantize_embeddings(self, embeddings, count):
+        """
+        Normalize embeddings and pack each one as int8 bytes with its scale
+        
+        A quarter of the float32 size to store and load; cosine scores move
+        by well under 1%. Returns (None, None) per chunk if unavailable.
+        """
+        try:
+            matrix = np.array(embeddings, dtype=np.float32)
+        except (TypeError, ValueError):
+            matrix = None
+        if matrix is None or matrix.ndim != 2 or len(matrix) != count:
+            return [(None, None)] * count
+        
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1)
+        
+        # Per-vector scale, so each vector's largest component maps to +-127
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return [(row.tobytes(), float(scale)) for row, scale in zip(quantized, scales)]
+    
+    @staticmethod
+    def _embedding_matrix(stored):
+        """
+        Stack stored (bytes, scale) embeddings into one (N, d) float32 matrix
+        
+        Chunks saved before quantization have no scale and hold float32
+        bytes. Returns None if the rows don't form a single matrix.
+        """
+        if len({len(data) for data, _ in stored}) != 1:
+            return None
+        data = b"".join(data for data, _ in stored)
+        scales = [scale for _, scale in stored]
+        
+        if all(scale is None for scale in scales):
+            return np.frombuffer(data, dtype=np.float32).reshape(len(stored), -1)
+        if None not in scales:
+            matrix = np.frombuffer(data, dtype=np.int8).reshape(len(stored), -1).astype(np.float32)
+            matrix *= np.array(scales, dtype=np.float32)[:, None]
+            return matrix
+        return None
+    
+    def _get_chunks(self, document_id=None):
+        """
+        Load chunk contents and their stored embeddings for a search
+        
+        Returns:
+            Tuple of (list of contents, (N, d) float32 matrix or None if any
+            chunk has no stored embedding)
+        """
+        cache_key = (document_id, self._corpus_version)
+        with self._cache_lock:
+            cached = self._chunk_cache.get(cache_key)
+            if cached is not None:
+                self._chunk_cache.move_to_end(cache_key)
+                return cached
+        
+        if document_id:
+            # Search only in specific document
+            chunks = DocumentChunk.objects.filter(
+                document_id=document_id,
+                document__processed=True
+            ).order_by('chunk_index')
+            logger.info(f"Searching in document {document_id}")
+        else:
+            # Search in all processed documents
+            chunks = DocumentChunk.objects.filter(
+                document__processed=True
+            ).order_by('document_id', 'chunk_index')
+            logger.info("Searching across all documents")
+        
+        rows = list(chunks.values_list('content', 'embedding', 'embedding_scale'))
+        chunk_contents = [content for content, _, _ in rows]
+        stored = [(bytes(embedding), scale) for _, embedding, scale in rows if embedding is not None]
+        
+        chunk_embeddings = None
+        if rows and len(stored) == len(rows):
+            # One contiguous (N, d) array, so scoring is a single matmul
+            chunk_embeddings = self._embedding_matrix(stored)
+        
+        with self._cache_lock:
+            if cache_key not in self._chunk_cache:
+                self._chunk_cache[cache_key] = (chunk_contents, chunk_embeddings)
+                self._chunk_cache_bytes += self._cache_entry_bytes(chunk_contents, chunk_embeddings)
+            # Keep at least the newest entry, even if it alone is over budget
+            while len(self._chunk_cache) > 1 and (
+                len(self._chunk_cache) > self.chunk_cache_size
+                or self._chunk_cache_bytes > self.chunk_cache_max_bytes
+            ):
+                _, evicted = self._chunk_cache.popitem(last=False)
+                self._chunk_cache_bytes -= self._cache_entry_bytes(*evicted)
+        return chunk_contents, chunk_embeddings
+    
+    @staticmethod
+    def _cache_entry_bytes(chunk_contents, chunk_embeddings):
+        """Approximate memory held by one chunk cache entry"""
+        size = sum(len(content) for content in chunk_contents)
+        if chunk_embeddings is not None:
+            size += chunk_embeddings.nbytes
+        return size
+    
+    def forget_document(self, document_id):
+        """Drop a deleted document's cached chunks and answers built from it"""
+        with self._cache_lock:
+            # Cached answers (and all-documents searches) may include its chunks
+            self._corpus_version += 1
+            for key in [key for key in self._chunk_cache if key[0] in (document_id, None)]:
+                self._chunk_cache_bytes -= self._cache_entry_bytes(*self._chunk_cache.pop(key))
+    
+    def _read_file(self, file_path, data=None):
         """
         Read content from a file
         
         Args:
             file_path: Path to the file
+            data: The file's bytes, if already read (then file_path is
+                only used for its name)
             
         Returns:
             String with file content
@@ -119,27 +308,33 @@ class DocumentProcessor:
         # Check file type and read accordingly
         if file_path.endswith('.txt'):
             # For text files, just read the content
+            if data is not None:
+                return data.decode('utf-8')
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
                 return content
         
         elif file_path.endswith('.pdf'):
-            # For PDF files, we need a PDF reader
+            # PyMuPDF's C parser is far faster than PyPDF2; keep PyPDF2 as a fallback
             try:
-                from PyPDF2 import PdfReader
-                reader = PdfReader(file_path)
-                
-                # Extract text from all pages
-                text = ""
-                for page_num, page in enumerate(reader.pages):
-                    page_text = page.extract_text()
-                    text += page_text + "\n"
-                    logger.info(f"Extracted text from page {page_num + 1}")
+                from .pdf_service import extract_pdf_text
+            except ImportError:
+                extract_pdf_text = None
+            
+            try:
+                if extract_pdf_text is not None:
+                    text, page_count = extract_pdf_text(file_path, data=data)
+                else:
+                    from PyPDF2 import PdfReader
+                    reader = PdfReader(io.BytesIO(data) if data is not None else file_path)
+                    text = "\n".join(page.extract_text() for page in reader.pages)
+                    page_count = len(reader.pages)
                 
+                logger.info(f"Extracted text from {page_count} pages")
                 return text
                 
             except ImportError:
-                raise Exception("PyPDF2 not installed. Run: pip install PyPDF2")
+                raise Exception("No PDF reader installed. Run: pip install PyMuPDF")
             except Exception as e:
                 raise Exception(f"Error reading PDF: {e}")
         
@@ -158,10 +353,11 @@ class DocumentProcessor:
             List of text chunks
         """
         # Split content into sentences first
-        sentences = content.split('.')
+        sentences = SENTENCE_BOUNDARY.split(content)
         
         chunks = []
-        current_chunk = ""
+        current_parts = []  # Joined once per chunk instead of growing a string
+        current_length = 0
         
         for sentence in sentences:
             sentence = sentence.strip()
@@ -169,18 +365,20 @@ class DocumentProcessor:
                 continue
             
             # If adding this sentence would make chunk too big, start a new chunk
-            if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = sentence + "."
-            else:
-                current_chunk += sentence + "."
+            if current_parts and current_length + len(sentence) > chunk_size:
+                chunks.append(" ".join(current_parts))
+                current_parts = []
+                current_length = 0
+            
+            current_parts.append(sentence)
+            current_length += len(sentence) + 1
         
         # Don't forget the last chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        if current_parts:
+            chunks.append(" ".join(current_parts))
         
         # Filter out very short chunks (less than 50 characters)
-        meaningful_chunks = [chunk for chunk in chunks if len(chunk.strip()) > 50]
+        meaningful_chunks = [chunk for chunk in chunks if len(chunk) > 50]
         
         logger.info(f"Created {len(meaningful_chunks)} meaningful chunks")
         return meaningful_chunks
@@ -201,26 +399,24 @@ class DocumentProcessor:
         logger.info(f"Answering question: '{question}'")
         
         try:
-            # Step 1: Get relevant document chunks from database
-            if document_id:
-                # Search only in specific document
-                chunks = DocumentChunk.objects.filter(
-                    document_id=document_id,
-                    document__processed=True
-                ).order_by('chunk_index')
-                logger.info(f"Searching in document {document_id}")
-            else:
-                # Search in all processed documents
-                chunks = DocumentChunk.objects.filter(
-                    document__processed=True
-                ).order_by('document_id', 'chunk_index')
-                logger.info("Searching across all documents")
-            
-            if not chunks.exists():
+            cache_key = (self._normalize_question(question), document_id, self._corpus_version)
+            with self._cache_lock:
+                context = self._context_cache.get(cache_key)
+                if context is not None:
+                    self._context_cache.move_to_end(cache_key)
+            if context is not None:
+                # Same question as before - skip the DB and similarity search;
+                # the API service has the answer itself cached too
+                logger.info("Reusing cached context for repeated question")
+                return self.api_service.answer_question(question, context)
+            
+            # Step 1: Get relevant document chunks (and their embeddings) from database
+            chunk_contents, chunk_embeddings = self._get_chunks(document_id)
+            
+            if not chunk_contents:
                 return "No processed documents found to answer your question."
             
-            # Step 2: Get chunk contents for similarity search
-            chunk_contents = [chunk.content for chunk in chunks]
+            # Step 2: Chunks with stored embeddings only need the question embedded
             logger.info(f"Comparing question against {len(chunk_contents)} chunks")
             
             # Step 3: Use the enhanced API service to find most relevant chunks
@@ -229,7 +425,8 @@ class DocumentProcessor:
                 relevant_chunks = self.api_service.find_most_relevant_chunks(
                     question, 
                     chunk_contents, 
-                    top_k=3
+                    top_k=3,
+                    chunk_embeddings=chunk_embeddings
                 )
                 
                 if not relevant_chunks:
@@ -251,20 +448,29 @@ class DocumentProcessor:
             except Exception as e:
                 logger.warning(f"Similarity search failed: {e}")
                 # Fallback to simple keyword matching
-                good_chunks = self._simple_keyword_fallback(question, chunk_contents)
+                good_chunks = self._simple_keyword_fallback(
+                    question,
+                    chunk_contents,
+                    index_key=(document_id, self._corpus_version, len(chunk_contents))
+                )
             
             # Step 4: Prepare context from the best chunks
+            # Whole chunks up to the character budget; the API service then
+            # cuts this to its exact token budget
             context_parts = []
+            context_length = 0
             for chunk in good_chunks:
-                context_parts.append(chunk['content'])
-            
+                content = chunk['content']
+                if context_parts and context_length + len(content) > self.max_context_chars:
+                    break
+                context_parts.append(content)
+                context_length += len(content) + 2  # Plus the separator
             context = "\n\n".join(context_parts)
             
-            # Limit context length for API efficiency
-            max_context_length = 2000
-            if len(context) > max_context_length:
-                context = context[:max_context_length] + "..."
-                logger.info(f"Truncated context to {max_context_length} characters")
+            with self._cache_lock:
+                self._context_cache[cache_key] = context
+                while len(self._context_cache) > self.context_cache_size:
+                    self._context_cache.popitem(last=False)
             
             # Step 5: Generate answer using AI
             logger.info("Generating AI answer...")
@@ -287,30 +493,81 @@ class DocumentProcessor:
             logger.error(f"Error answering question: {e}")
             return "Sorry, I encountered an error while trying to answer your question. Please try again."
     
-    def _simple_keyword_fallback(self, question, chunk_contents):
+    def answer_questions(self, questions, document_id=None, max_workers=8):
+        """
+        Answer several questions about the same document at once
+        
+        The chunks and their embeddings are loaded once and shared; the
+        per-question model calls then run concurrently.
+        
+        Returns:
+            List of answers, in the same order as questions
+        """
+        if not questions:
+            return []
+        
+        # Warm the chunk cache here, so the worker threads don't each query it
+        self._get_chunks(document_id)
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(questions))) as executor:
+            return list(executor.map(lambda question: self.answer_question(question, document_id), questions))
+    
+    @staticmethod
+    def _normalize_question(question):
+        """Lowercase, drop punctuation and collapse whitespace for cache keys"""
+        return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+    
+    def _simple_keyword_fallback(self, question, chunk_contents, index_key=None):
         """
         Fallback search method when similarity API fails
+        
+        Scores chunks by how many question words they contain, using an
+        inverted index that is built once per index_key (document and
+        corpus version) instead of re-tokenizing every chunk per question
         """
         logger.info("Using keyword fallback search")
         
         question_words = set(word.lower().strip('.,!?') for word in question.split() if len(word) > 2)
+        if not question_words or not chunk_contents:
+            return []
+        
+        inverted_index = self._get_inverted_index(chunk_contents, index_key)
+        
+        overlaps = Counter()
+        for word in question_words - {''}:
+            overlaps.update(inverted_index.get(word, ()))
         
-        scored_chunks = []
+        # Top 3 by overlap, normalized by question length, ties in document order
+        top_chunks = heapq.nsmallest(3, overlaps.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            {
+                'content': chunk_contents[i],
+                'similarity_score': overlap / len(question_words),
+                'index': i
+            }
+            for i, overlap in top_chunks
+        ]
+    
+    def _get_inverted_index(self, chunk_contents, index_key=None):
+        """Map each word to the chunks containing it, cached by index_key"""
+        if index_key is not None:
+            with self._cache_lock:
+                inverted_index = self._inverted_indexes.get(index_key)
+                if inverted_index is not None:
+                    self._inverted_indexes.move_to_end(index_key)
+                    return inverted_index
+        
+        inverted_index = {}
         for i, content in enumerate(chunk_contents):
-            content_words = set(word.lower().strip('.,!?') for word in content.split())
-            overlap = len(question_words.intersection(content_words))
-            
-            if overlap > 0:
-                score = overlap / len(question_words)  # Normalize by question length
-                scored_chunks.append({
-                    'content': content,
-                    'similarity_score': score,
-                    'index': i
-                })
+            for word in set(word.lower().strip('.,!?') for word in content.split()):
+                inverted_index.setdefault(word, []).append(i)
         
-        # Sort by score and return top 3
-        scored_chunks.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return scored_chunks[:3]
+        if index_key is not None:
+            with self._cache_lock:
+                self._inverted_indexes[index_key] = inverted_index
+                while len(self._inverted_indexes) > self.inverted_index_cache_size:
+                    self._inverted_indexes.popitem(last=False)
+        return inverted_index
     
     def get_document_summary(self, document_id):
         """
@@ -318,24 +575,25 @@ class DocumentProcessor:
         """
         try:
             document = Document.objects.get(id=document_id)
-            chunks = document.chunks.all()
             
-            if not chunks.exists():
-                return "Document not found or not processed yet."
+            # Only the text is needed - no model instances, one query
+            chunk_contents = list(
+                document.chunks.order_by('chunk_index').values_list('content', flat=True)
+            )
             
-            # Get all chunk contents
-            chunk_contents = [chunk.content for chunk in chunks]
+            if not chunk_contents:
+                return "Document not found or not processed yet."
             
             # Find chunks that are similar to "summary" or "overview"
             summary_queries = ["summary of this document", "what is this document about", "main topics"]
             
+            # Ask all summary queries at once - each one is a separate API call
             all_relevant_chunks = []
-            for query in summary_queries:
-                try:
-                    relevant = self.api_service.find_most_relevant_chunks(query, chunk_contents, top_k=2)
+            try:
+                for relevant in self.api_service.find_most_relevant_chunks_batch(summary_queries, chunk_contents, top_k=2):
                     all_relevant_chunks.extend(relevant)
-                except:
-                    pass  # Skip if similarity search fails
+            except Exception:
+                pass  # Skip if similarity search fails
             
             # Remove duplicates and get best chunks
             seen_content = set()
@@ -345,9 +603,8 @@ class DocumentProcessor:
                     seen_content.add(chunk['content'])
                     unique_chunks.append(chunk)
             
-            # Sort by score and take best ones
-            unique_chunks.sort(key=lambda x: x['similarity_score'], reverse=True)
-            best_chunks = unique_chunks[:3]
+            # Take the best ones by score (stable for ties, like a sort)
+            best_chunks = heapq.nlargest(3, unique_chunks, key=lambda x: x['similarity_score'])
             
             if best_chunks:
                 summary_context = "\n\n".join([chunk['content'] for chunk in best_chunks])
@@ -365,6 +622,25 @@ class DocumentProcessor:
             return "Could not generate document summary."
 
 
+_shared_processor = None
+_shared_processor_lock = threading.Lock()
+
+
+def get_shared_processor():
+    """
+    One DocumentProcessor per process
+    
+    Its chunk, context and keyword-index caches only pay off if requests
+    share it; upload threads and request threads may ask for it at once.
+    """
+    global _shared_processor
+    if _shared_processor is None:
+        with _shared_processor_lock:
+            if _shared_processor is None:
+                _shared_processor = DocumentProcessor()
+    return _shared_processor
+
+
 # Test function to demonstrate the complete workflow
 def test_complete_workflow():
     """
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import services
+from .models import Document
+
+
+@receiver(post_delete, sender=Document)
+def forget_deleted_document(sender, instance, **kwargs):
+    """Free the shared processor's cached chunks for a deleted document"""
+    # Only a processor that already exists can hold them - don't create one
+    processor = services._shared_processor
+    if processor is not None:
+        processor.forget_document(instance.pk)
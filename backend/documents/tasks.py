@@ -0,0 +1,37 @@
+import logging
+
+from celery import shared_task
+
+from .models import Document
+from .services import get_shared_processor
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def process_document_task(self, document_id):
+    """Process an uploaded document on a Celery worker (retried on failure)"""
+    try:
+        document = Document.objects.get(pk=document_id)
+    except Document.DoesNotExist:
+        # Deleted before a worker picked it up - nothing to do
+        logger.warning(f"Document {document_id} no longer exists, skipping processing")
+        return
+    
+    try:
+        get_shared_processor().process_document(document)
+    except Exception as e:
+        # Processing is atomic, so a retry starts from a clean slate
+        raise self.retry(exc=e)
+
+
+@shared_task
+def answer_question_task(question, document_id):
+    """Answer a question about a document on a Celery worker"""
+    document = Document.objects.get(pk=document_id)
+    return {
+        'answer': get_shared_processor().answer_question(question, document_id),
+        'question': question,
+        'document_title': document.title,
+        'document_id': document_id
+    }
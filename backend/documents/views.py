@@ -1,15 +1,62 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils.cache import quote_etag
+from django.utils.http import parse_etags
 from .models import Document
 from .serializers import DocumentSerializer
-from .services import DocumentProcessor
-from functools import lru_cache
+from .services import get_shared_api_service, get_shared_processor
+import queue
 import threading
 import logging
+import zlib
 
 logger = logging.getLogger(__name__)
 
+# Most questions accepted by one ask_questions request
+MAX_BATCH_QUESTIONS = 16
+
+# Without Celery, uploads wait in this queue for a few long-lived threads
+PROCESSING_THREADS = 2
+_processing_queue = queue.Queue()
+_processing_threads = []
+_processing_threads_lock = threading.Lock()
+
+
+def _process_queued_documents():
+    """Process uploaded documents from the queue - runs on a worker thread"""
+    while True:
+        document_id = _processing_queue.get()
+        try:
+            document = Document.objects.get(pk=document_id)
+            get_shared_processor().process_document(document)
+            logger.info(f"Document processing completed: {document.title}")
+        except Document.DoesNotExist:
+            logger.info(f"Document {document_id} was deleted before processing")
+        except Exception as e:
+            logger.error(f"Error processing document {document_id}: {e}")
+        finally:
+            # The thread outlives the request - don't keep its connection open
+            close_old_connections()
+
+
+def _enqueue_processing(document_id):
+    """Queue a document for the processing threads, starting them on first use"""
+    with _processing_threads_lock:
+        if not _processing_threads:
+            for i in range(PROCESSING_THREADS):
+                thread = threading.Thread(
+                    target=_process_queued_documents, name=f'document-processing-{i}', daemon=True
+                )
+                thread.start()
+                _processing_threads.append(thread)
+    _processing_queue.put(document_id)
+
+
 class DocumentViewSet(viewsets.ModelViewSet):
     """
     API endpoints for documents
@@ -25,17 +72,16 @@ class DocumentViewSet(viewsets.ModelViewSet):
     
     serializer_class = DocumentSerializer
     
-    @lru_cache(maxsize=1)
-    def get_processor(self):
-        """Get cached processor instance"""
-        return DocumentProcessor()
-    
     def get_queryset(self):
         """
         Only show documents that belong to the current user
         This is important for security - users shouldn't see each other's documents
         """
-        return Document.objects.filter(user=self.request.user)
+        queryset = Document.objects.filter(user=self.request.user)
+        if self.action == 'status':
+            # Count chunks in the same query that loads the document
+            queryset = queryset.annotate(chunk_count=Count('chunks'))
+        return queryset
     
     def perform_create(self, serializer):
         """
@@ -43,26 +89,26 @@ class DocumentViewSet(viewsets.ModelViewSet):
         
         Steps:
         1. Save the document to database
-        2. Start processing it in the background
+        2. Start processing it in the background (on a Celery worker if
+           CELERY_BROKER_URL is set, otherwise in a thread of this process)
         """
         document = serializer.save(user=self.request.user)
         logger.info(f"Document created: {document.title} (ID: {document.id})")
         
-        # Process document in background thread
-        def process_document():
-            try:
-                # Use cached processor
-                processor = self.get_processor()
-                processor.process_document(document)
-                logger.info(f"Document processing completed: {document.title}")
-            except Exception as e:
-                logger.error(f"Error processing document {document.id}: {e}")
-        
-        thread = threading.Thread(target=process_document)
-        thread.daemon = True
-        thread.start()
-        
-        logger.info(f"Background processing started for document: {document.title}")
+        if settings.CELERY_BROKER_URL:
+            def enqueue():
+                from .tasks import process_document_task
+                process_document_task.delay(document.id)
+            
+            # Queue only once the row is committed, so the worker can load it
+            transaction.on_commit(enqueue)
+            logger.info(f"Queued processing for document: {document.title}")
+            return
+        
+        # Process document on a background thread of this process, once the
+        # row is committed and visible to that thread
+        transaction.on_commit(lambda: _enqueue_processing(document.id))
+        logger.info(f"Background processing queued for document: {document.title}")
     
     @action(detail=True, methods=['post'])
     def ask_question(self, request, pk=None):
@@ -73,6 +119,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
         Body: {"question": "What is this document about?"}
         
         Returns: {"answer": "This document is about...", "question": "..."}
+        
+        With a Celery broker configured, add "async": true to the body to get
+        202 {"task_id": "..."} right away and poll answer_result for the answer.
         """
         document = self.get_object()
         question = request.data.get('question')
@@ -91,9 +140,21 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 'document_processed': False
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        if settings.CELERY_BROKER_URL and request.data.get('async') in (True, 'true', '1'):
+            from .tasks import answer_question_task
+            
+            # Don't hold this web worker for the model round-trip
+            task = answer_question_task.delay(question, document.id)
+            logger.info(f"Queued question for document {document.id} as task {task.id}")
+            return Response({
+                'task_id': task.id,
+                'question': question,
+                'document_id': document.id
+            }, status=status.HTTP_202_ACCEPTED)
+        
         try:
-            # Use cached processor
-            processor = self.get_processor()
+            # Use the shared processor
+            processor = get_shared_processor()
             answer = processor.answer_question(question, document.id)
             
             logger.info(f"Question answered successfully for document {document.id}")
@@ -111,6 +172,91 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 'error': 'An error occurred while processing your question. Please try again.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=True, methods=['post'])
+    def ask_questions(self, request, pk=None):
+        """
+        Ask several questions about a document in one request
+        
+        URL: POST /api/documents/123/ask_questions/
+        Body: {"questions": ["What is this about?", "Who wrote it?"]}
+        
+        Returns: {"answers": [{"question": "...", "answer": "..."}, ...]}
+        in the order the questions were sent
+        """
+        document = self.get_object()
+        questions = request.data.get('questions')
+        
+        if (not isinstance(questions, list) or not questions
+                or not all(isinstance(question, str) and question.strip() for question in questions)):
+            return Response({
+                'error': 'questions must be a non-empty list of questions'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            return Response({
+                'error': f'At most {MAX_BATCH_QUESTIONS} questions per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not document.processed:
+            return Response({
+                'error': 'Document is still being processed. Please wait a moment and try again.',
+                'document_processed': False
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger.info(f"{len(questions)} questions asked for document {document.id}")
+        
+        try:
+            answers = get_shared_processor().answer_questions(questions, document.id)
+            
+            return Response({
+                'answers': [
+                    {'question': question, 'answer': answer}
+                    for question, answer in zip(questions, answers)
+                ],
+                'document_title': document.title,
+                'document_id': document.id
+            })
+            
+        except Exception as e:
+            logger.error(f"Error answering questions for document {document.id}: {e}")
+            return Response({
+                'error': 'An error occurred while processing your questions. Please try again.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['get'], url_path=r'answers/(?P<task_id>[^/.]+)')
+    def answer_result(self, request, task_id=None):
+        """
+        Poll for the answer to a question asked with "async": true
+        
+        URL: GET /api/documents/answers/<task_id>/
+        Returns: {"state": "PENDING"} until done, then the same fields as ask_question
+        """
+        if not settings.CELERY_BROKER_URL:
+            # Without a broker questions are always answered directly
+            return Response({
+                'error': 'Asynchronous answers are not enabled'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        from celery.result import AsyncResult
+        
+        result = AsyncResult(task_id)
+        if not result.ready():
+            return Response({'task_id': task_id, 'state': result.state})
+        
+        if result.failed():
+            logger.error(f"Question task {task_id} failed: {result.result}")
+            return Response({
+                'error': 'An error occurred while processing your question. Please try again.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        answer = result.result
+        # Only answer_question_task results, and only for the document's owner
+        if (not isinstance(answer, dict) or 'document_id' not in answer
+                or not self.get_queryset().filter(pk=answer['document_id']).exists()):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({'task_id': task_id, 'state': result.state, **answer})
+    
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """
@@ -118,21 +264,31 @@ class DocumentViewSet(viewsets.ModelViewSet):
         
         URL: GET /api/documents/123/status/
         Returns: {"processed": true, "chunk_count": 5}
+        
+        Sends an ETag; polling with If-None-Match gets an empty 304 until
+        something changes.
         """
         document = self.get_object()
         
+        # Built from every field that can change after upload
+        etag = quote_etag('{}-{}-{}-{}-{:x}'.format(
+            document.id, document.status, int(document.processed),
+            document.chunk_count, zlib.crc32(document.title.encode('utf-8'))
+        ))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
         return Response({
             'document_id': document.id,
             'title': document.title,
             'processed': document.processed,
+            'status': document.status,
             'uploaded_at': document.uploaded_at,
-            'chunk_count': document.chunks.count()
-        })
+            'chunk_count': document.chunk_count
+        }, headers={'ETag': etag})
 
-# Simple test view to check if API service is working
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
 
+# Simple test view to check if API service is working
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def test_api(request):
@@ -146,19 +302,18 @@ def test_api(request):
         question = request.data.get('question', 'What is this about?')
         context = request.data.get('context', 'This is a test document about technology.')
         
-        # Test our API service
-        from .huggingface_api_service import HuggingFaceAPIService
-        service = HuggingFaceAPIService()
+        # Test our (shared) API service
+        service = get_shared_api_service()
         
         # Test both functions
-        embeddings = service.get_embeddings([context])
+        embeddings = service.get_embeddings([context], as_numpy=True)
         answer = service.answer_question(question, context)
         
         return Response({
             'question': question,
             'context': context,
             'answer': answer,
-            'embeddings_count': len(embeddings[0]) if embeddings else 0,
+            'embeddings_count': embeddings.shape[1] if len(embeddings) else 0,
             'status': 'success'
         })
         
@@ -6,6 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
+    if len(sys.argv) > 1 and sys.argv[1] == 'test':
+        # Tests use their own, faster settings (in-memory DB etc.)
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'docqa_backend.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'docqa_backend.settings')
     try:
         from django.core.management import execute_from_command_line
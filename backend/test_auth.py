@@ -1,5 +1,4 @@
 import requests
-import json
 
 def test_auth_endpoints():
     base_url = 'http://localhost:8000/auth'
@@ -12,12 +11,11 @@ def test_auth_endpoints():
         'email': 'test@example.com'
     }
     
+    # One session, so login reuses the registration request's connection
+    session = requests.Session()
+    
     try:
-        response = requests.post(
-            f'{base_url}/register/',
-            headers={'Content-Type': 'application/json'},
-            data=json.dumps(register_data)
-        )
+        response = session.post(f'{base_url}/register/', json=register_data)
         print(f"Registration Status: {response.status_code}")
         print(f"Registration Response: {response.json()}")
         
@@ -31,11 +29,7 @@ def test_auth_endpoints():
                 'password': 'testpass123'
             }
             
-            login_response = requests.post(
-                f'{base_url}/login/',
-                headers={'Content-Type': 'application/json'},
-                data=json.dumps(login_data)
-            )
+            login_response = session.post(f'{base_url}/login/', json=login_data)
             print(f"Login Status: {login_response.status_code}")
             print(f"Login Response: {login_response.json()}")
             